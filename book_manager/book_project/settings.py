@@ -27,6 +27,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  
+    'books.middleware.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -41,13 +42,20 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Разобранные шаблоны хранятся в памяти процесса (и при DEBUG тоже)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'books.context_processors.catalog_stats',
             ],
         },
     },
@@ -58,14 +66,26 @@ TEMPLATES = [
 
 # Используем PostgreSQL в Docker, SQLite локально
 if os.environ.get('DOCKER_CONTAINER'):
+    # Пул соединений внутри процесса (books.db_pool): соединение возвращается в пул
+    # в конце запроса, поэтому CONN_MAX_AGE с пулом не нужен
+    BOOKS_DB_POOL = os.environ.get('BOOKS_DB_POOL', 'False') == 'True'
     DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'books.db_pool' if BOOKS_DB_POOL else 'django.db.backends.postgresql',
         'NAME': os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': 'db',  # ← обязательно 'db'
         'PORT': '5432',
+        # Без пула соединение живёт столько секунд и переиспользуется следующими запросами
+        'CONN_MAX_AGE': 0 if BOOKS_DB_POOL else int(os.environ.get('BOOKS_DB_CONN_MAX_AGE', '60')),
+        # SELECT 1 перед повторным использованием - после рестарта PostgreSQL запрос не упадёт
+        'CONN_HEALTH_CHECKS': os.environ.get('BOOKS_DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        # Размер пула - на процесс (воркер gunicorn или run_jobs), ожидание - в секундах
+        'POOL': {
+            'SIZE': int(os.environ.get('BOOKS_DB_POOL_SIZE', '10')),
+            'TIMEOUT': float(os.environ.get('BOOKS_DB_POOL_TIMEOUT', '10')),
+        },
     }
 }
 else:
@@ -116,6 +136,78 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Data files (для ваших JSON/XML файлов)
 DATA_ROOT = BASE_DIR / 'data'
 
+# Задержка (в секундах) перед обслуживанием books.json после изменения каталога.
+# Все изменения за это время объединяются в одну проверку; 0 - проверять сразу
+BOOKS_SNAPSHOT_DELAY = float(os.environ.get('BOOKS_SNAPSHOT_DELAY', '2'))
+
+# Размер журнала books.journal.jsonl (в байтах), после которого он переносится в books.json
+BOOKS_JOURNAL_MAX_BYTES = int(os.environ.get('BOOKS_JOURNAL_MAX_BYTES', str(1024 * 1024)))
+
+# Память процесса под разобранный books.json (оценка, в байтах). Книги кэшируются всегда
+# (около 1 КБ на книгу), а построенные по ним сортировка и индексы вытесняются, если не
+# помещаются. 1M книг - это около 500 МБ JSON, 0.9 ГБ книг и 0.7 ГБ всех структур,
+# поэтому по умолчанию 2 ГБ: при 1M книг в памяти остаётся всё
+BOOKS_FILE_CACHE_MAX_BYTES = int(os.environ.get('BOOKS_FILE_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+
+# Потоки для параллельного поиска в БД и в файле
+BOOKS_SEARCH_WORKERS = int(os.environ.get('BOOKS_SEARCH_WORKERS', '4'))
+# Сколько секунд ждать БД, если файл уже заполнил весь список подсказок
+BOOKS_SEARCH_GRACE = float(os.environ.get('BOOKS_SEARCH_GRACE', '0.05'))
+
+# Сколько экспортов хранить в DATA_ROOT: штук, секунд с создания, байт всего
+BOOKS_EXPORTS_MAX_COUNT = int(os.environ.get('BOOKS_EXPORTS_MAX_COUNT', '10'))
+BOOKS_EXPORTS_MAX_AGE = int(os.environ.get('BOOKS_EXPORTS_MAX_AGE', str(7 * 24 * 60 * 60)))
+BOOKS_EXPORTS_MAX_BYTES = int(os.environ.get('BOOKS_EXPORTS_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+# Метрики запросов, SQL и файлового ввода-вывода (/metrics/); при False middleware не подключается
+BOOKS_METRICS = os.environ.get('BOOKS_METRICS', 'True') == 'True'
+
+# Импорт и экспорт в фоне: запрос ставит задачу в очередь, выполняет её manage.py run_jobs
+BOOKS_BACKGROUND_JOBS = os.environ.get('BOOKS_BACKGROUND_JOBS', 'False') == 'True'
+# Сколько задач run_jobs выполняет одновременно
+BOOKS_JOB_WORKERS = int(os.environ.get('BOOKS_JOB_WORKERS', '2'))
+# Через сколько секунд без обновления прогресса задача считается зависшей
+BOOKS_JOBS_STALE_AFTER = int(os.environ.get('BOOKS_JOBS_STALE_AFTER', '600'))
+
+# Кэш: в памяти процесса, а если задан REDIS_URL - общий Redis для всех воркеров
+# (для Redis нужен пакет redis; вытеснение задаётся maxmemory-policy allkeys-lru)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+        'search': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'search',
+        },
+        # Фрагменты шаблонов ({% cache %}), например строки списка книг
+        'template_fragments': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'fragments',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        # Результаты поиска; LocMemCache вытесняет давно не использованные записи
+        'search': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'books-search',
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('BOOKS_SEARCH_CACHE_ENTRIES', '2000'))},
+        },
+        'template_fragments': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'books-fragments',
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('BOOKS_FRAGMENT_CACHE_ENTRIES', '5000'))},
+        },
+    }
+CACHES['search']['TIMEOUT'] = int(os.environ.get('BOOKS_SEARCH_CACHE_TIMEOUT', '300'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
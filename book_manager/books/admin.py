@@ -1,9 +1,15 @@
 from django.contrib import admin
-from .models import Book
+from .models import Book, Job
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     list_display = ['title', 'author', 'publication_year', 'genre', 'created_at']
     list_filter = ['genre', 'publication_year', 'created_at']
     search_fields = ['title', 'author', 'isbn']
-    ordering = ['-created_at']
\ No newline at end of file
+    ordering = ['-created_at']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'progress', 'total', 'worker', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status']
+    ordering = ['-created_at']
@@ -0,0 +1,140 @@
+import json
+from datetime import date, datetime
+
+from django.db.models import Q
+from django.http import HttpResponse
+
+from .models import Book
+from .pagination import decode_cursor, paginate_queryset, paginate_sorted
+from .utils import BOOK_FIELDS, FileHandler
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Книг на странице API по умолчанию и максимум (?limit=)
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Параметр запроса -> поле книги; фильтр - точное совпадение
+API_FILTERS = {
+    'genre': 'genre',
+    'langua': 'langua',
+    'author': 'author',
+    'year': 'publication_year',
+}
+
+# Без них не построить курсор следующей страницы
+_CURSOR_FIELDS = ('created_at', 'id')
+
+
+class ApiError(Exception):
+    """Некорректный запрос к API - ответ 400 с текстом ошибки"""
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def json_response(data, status=200):
+    """JSON-ответ через orjson, если он установлен, иначе через json"""
+    if orjson is not None:
+        content = orjson.dumps(data)
+    else:
+        content = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+    return HttpResponse(content, status=status, content_type='application/json')
+
+
+def parse_fields(value):
+    """?fields=title,author -> кортеж полей; без параметра - все поля книги"""
+    if not value:
+        return BOOK_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in BOOK_FIELDS]
+    if unknown or not fields:
+        raise ApiError(f'неизвестные поля: {", ".join(unknown)}; доступны: {", ".join(BOOK_FIELDS)}')
+    return fields
+
+
+def _parse_filters(params):
+    filters = {}
+    for param, field in API_FILTERS.items():
+        value = params.get(param)
+        if not value:
+            continue
+        if field == 'publication_year':
+            try:
+                value = int(value)
+            except ValueError:
+                raise ApiError('year должен быть числом')
+        filters[field] = value
+    return filters
+
+
+def _parse_limit(value):
+    if not value:
+        return API_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return max(1, min(limit, API_MAX_PAGE_SIZE))
+
+
+def list_books(params):
+    """Страница книг: {'results': [...], 'next': курсор или None}.
+
+    params - request.GET: source (db/file), fields, q, фильтры из API_FILTERS,
+    limit и after. Порядок - от новых к старым, как в book_list.
+    """
+    fields = parse_fields(params.get('fields'))
+    filters = _parse_filters(params)
+    query = params.get('q', '')
+    limit = _parse_limit(params.get('limit'))
+    after = params.get('after')
+    if after and decode_cursor(after) is None:
+        # Страницы сайта при испорченном курсоре показывают начало списка, API - отвечает ошибкой
+        raise ApiError('некорректный курсор after')
+
+    if params.get('source', 'db') == 'file':
+        if query:
+            records, keys, index = FileHandler.load_search_index()
+            positions = index.search(query)
+        else:
+            records, keys = FileHandler.load_books_sorted()
+            positions = range(len(records))
+        if filters:
+            positions = [
+                i for i in positions
+                if all(getattr(records[i], field) == value for field, value in filters.items())
+            ]
+        if query or filters:
+            records, keys = [records[i] for i in positions], [keys[i] for i in positions]
+        page = paginate_sorted(records, keys, after, per_page=limit)
+        # BookRecord - namedtuple, поля берём без построения полного словаря
+        results = [{field: getattr(record, field) for field in fields} for record in page]
+    else:
+        books = Book.objects.filter(**filters)
+        if query:
+            books = books.filter(Q(title__icontains=query) | Q(author__icontains=query) | Q(description__icontains=query))
+        # values() вместо моделей: из БД читаются только нужные столбцы
+        extra = tuple(field for field in _CURSOR_FIELDS if field not in fields)
+        page = paginate_queryset(books.values(*fields, *extra), after, per_page=limit)
+        results = page.object_list
+        for row in results:
+            for field in extra:
+                del row[field]
+
+    return {'results': results, 'next': page.next_cursor}
+
+
+def get_book(book_id, params):
+    """Одна книга (только выбранные поля) или None"""
+    fields = parse_fields(params.get('fields'))
+    if params.get('source', 'db') == 'file':
+        record = FileHandler.load_books_by_id().get(book_id)
+        return None if record is None else {field: getattr(record, field) for field in fields}
+    return Book.objects.filter(pk=book_id).values(*fields).first()
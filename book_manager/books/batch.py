@@ -0,0 +1,179 @@
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, transaction
+
+from .importers import build_book, load_missing_ids
+from .models import Book, book_fingerprint
+from .signals import journal_suppressed
+from .snapshot import CatalogSnapshot
+from .stats import book_stats_values
+from .utils import FileHandler
+
+# Сколько операций (create + update + delete) принимается одним запросом
+MAX_BATCH_OPERATIONS = 10000
+
+# Наибольший размер тела запроса; проверяется до разбора JSON
+MAX_BATCH_BYTES = 10 * 1024 * 1024
+
+# Поля, которые можно менять через update; fingerprint пересчитывается из них
+UPDATE_FIELDS = ('title', 'author', 'isbn', 'publication_year', 'genre', 'langua', 'page_count', 'description')
+
+
+class BatchError(Exception):
+    """Пакет отклонён целиком; errors - [(операция, номер в списке, текст ошибки)]"""
+
+    def __init__(self, errors):
+        super().__init__(f'Ошибок в пакете: {len(errors)}')
+        self.errors = errors
+
+
+def _as_list(payload, key):
+    items = payload.get(key) or []
+    if not isinstance(items, list):
+        raise BatchError([(key, None, 'ожидался список')])
+    return items
+
+
+def _book_id(value):
+    # bool - подкласс int, но id книги это не делает
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValidationError('id книги должен быть числом')
+
+
+def _prepare(payload):
+    """Проверяет пакет до записи в БД и возвращает (новые книги, изменённые книги, удаляемые id)"""
+    if not isinstance(payload, dict):
+        raise BatchError([(None, None, 'ожидался объект с полями create, update, delete')])
+    creates = _as_list(payload, 'create')
+    updates = _as_list(payload, 'update')
+    deletes = _as_list(payload, 'delete')
+    if len(creates) + len(updates) + len(deletes) > MAX_BATCH_OPERATIONS:
+        raise BatchError([(None, None, f'не больше {MAX_BATCH_OPERATIONS} операций за запрос')])
+
+    errors = []
+    new_books = []
+    for i, data in enumerate(creates):
+        try:
+            new_books.append(build_book(data))
+        except ValidationError as e:
+            errors.append(('create', i, '; '.join(e.messages)))
+
+    update_ids, delete_ids = [], []
+    for key, items, ids in (('update', updates, update_ids), ('delete', deletes, delete_ids)):
+        for i, item in enumerate(items):
+            try:
+                if key == 'update' and not isinstance(item, dict):
+                    raise ValidationError('изменение должно быть объектом с id')
+                ids.append(_book_id(item.get('id') if key == 'update' else item))
+            except ValidationError as e:
+                errors.append((key, i, '; '.join(e.messages)))
+                ids.append(None)
+
+    # Одна книга - одна операция в пакете
+    seen = set()
+    for key, ids in (('update', update_ids), ('delete', delete_ids)):
+        for i, book_id in enumerate(ids):
+            if book_id is None:
+                continue
+            if book_id in seen:
+                errors.append((key, i, f'книга {book_id} уже есть в пакете'))
+            seen.add(book_id)
+
+    # Изменяемые книги - одним запросом, с блокировкой строк до конца транзакции
+    existing = Book.objects.select_for_update().in_bulk([book_id for book_id in seen])
+    for key, ids in (('update', update_ids), ('delete', delete_ids)):
+        for i, book_id in enumerate(ids):
+            if book_id is not None and book_id not in existing:
+                errors.append((key, i, f'книга {book_id} не найдена'))
+
+    changed_books = []
+    for i, (data, book_id) in enumerate(zip(updates, update_ids)):
+        book = existing.get(book_id)
+        if book is None:
+            continue
+        unknown = set(data) - set(UPDATE_FIELDS) - {'id'}
+        if unknown:
+            errors.append(('update', i, f'неизвестные поля: {", ".join(sorted(unknown))}'))
+            continue
+        try:
+            # Проверяем книгу целиком, как при импорте: старые значения плюс новые
+            checked = build_book({**FileHandler.book_to_dict(book), **data})
+        except ValidationError as e:
+            errors.append(('update', i, '; '.join(e.messages)))
+            continue
+        book._stats_old = book_stats_values(book)
+        for field in UPDATE_FIELDS:
+            setattr(book, field, getattr(checked, field))
+        # bulk_update не вызывает pre_save, поэтому отпечаток считаем сами
+        book.fingerprint = book_fingerprint(book.title, book.author, book.publication_year)
+        changed_books.append((i, book))
+
+    deleted = [existing[book_id] for book_id in delete_ids if book_id in existing]
+    errors.extend(_find_duplicates(new_books, changed_books, seen))
+    if errors:
+        raise BatchError(errors)
+    return new_books, [book for _, book in changed_books], deleted
+
+
+def _find_duplicates(new_books, changed_books, touched_ids):
+    """Дубликаты среди новых и изменённых книг, а также с книгами в БД - одним запросом"""
+    candidates = [('update', i, book) for i, book in changed_books]
+    candidates += [('create', i, book) for i, book in enumerate(new_books)]
+    fingerprints = [
+        book.fingerprint or book_fingerprint(book.title, book.author, book.publication_year)
+        for _, _, book in candidates
+    ]
+    # Книги из пакета сравниваем с их новыми значениями, а не с тем, что сейчас в БД
+    known = set(
+        Book.objects.filter(fingerprint__in=fingerprints)
+        .exclude(pk__in=touched_ids)
+        .values_list('fingerprint', flat=True)
+    )
+    errors = []
+    for (key, i, _), fingerprint in zip(candidates, fingerprints):
+        if fingerprint in known:
+            errors.append((key, i, 'такая книга уже есть в каталоге'))
+        known.add(fingerprint)
+    return errors
+
+
+def apply_batch(payload):
+    """Применяет пакет {'create': [...], 'update': [{'id': ..., поля}], 'delete': [id, ...]}.
+
+    Всё выполняется одной транзакцией: при любой ошибке (BatchError) ничего
+    не сохраняется. books.json и статистика обновляются одной записью журнала.
+    Возвращает {'created': [id новых книг], 'updated': число, 'deleted': число}.
+    """
+    try:
+        with transaction.atomic():
+            new_books, changed_books, deleted = _prepare(payload)
+
+            if deleted:
+                # post_delete приходит на каждую книгу; в журнал весь пакет пишется ниже одной записью
+                with journal_suppressed():
+                    Book.objects.filter(pk__in=[book.pk for book in deleted]).delete()
+            if changed_books:
+                Book.objects.bulk_update(changed_books, UPDATE_FIELDS + ('fingerprint',))
+            created = Book.objects.bulk_create(new_books)
+            load_missing_ids(created)
+    except IntegrityError:
+        # Такую же книгу только что сохранил другой запрос
+        raise BatchError([(None, None, 'такая книга уже есть в каталоге')])
+    except DatabaseError as e:
+        # Значение, которое СУБД не приняла, хотя build_book его пропустил
+        raise BatchError([(None, None, f'ошибка базы данных: {e}')])
+
+    entries = [{'op': 'delete', 'id': book.pk} for book in deleted]
+    entries += [{'op': 'update', 'book': FileHandler.book_to_dict(book)} for book in changed_books]
+    changes = [(('db', 'file'), book_stats_values(book), None) for book in deleted]
+    changes += [(('db', 'file'), book._stats_old, book_stats_values(book)) for book in changed_books]
+    entries += [{'op': 'insert', 'book': FileHandler.book_to_dict(book)} for book in created]
+    changes += [(('db', 'file'), None, book_stats_values(book)) for book in created]
+    if entries:
+        transaction.on_commit(lambda: CatalogSnapshot.record(entries, changes))
+
+    return {
+        'created': [book.pk for book in created],
+        'updated': len(changed_books),
+        'deleted': len(deleted),
+    }
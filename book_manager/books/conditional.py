@@ -0,0 +1,81 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.contrib import messages
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .export_manager import ExportManager
+from .utils import FileHandler, ParsedFileCache
+
+
+def _last_modified(signature):
+    # Самый поздний mtime из подписи ParsedFileCache - с точностью до секунды, как в HTTP
+    mtimes = [part[0] for part in signature if part]
+    if not mtimes:
+        return None
+    return datetime.fromtimestamp(max(mtimes) // 10**9, tz=timezone.utc)
+
+
+def _has_messages(request):
+    # Сообщение показывается один раз - такую страницу нельзя отдавать как 304
+    return len(messages.get_messages(request)) > 0
+
+
+def _catalog_version(request):
+    """(ETag, Last-Modified) страниц каталога или None, если страницу надо отрисовать.
+
+    Версия - подпись каталога данных: books.json, журнал и mtime каталога (файлы
+    в нём - в статистике на страницах). Каждое изменение книг в БД попадает
+    в журнал, поэтому подпись одна для всех воркеров и не меняется при рестарте.
+    Ни ORM, ни чтения файлов - только stat().
+    """
+    if not hasattr(request, '_catalog_version'):
+        if _has_messages(request):
+            request._catalog_version = None
+        else:
+            file_signature, dir_mtime_ns = FileHandler.data_signature()
+            etag = hashlib.md5(repr((file_signature, dir_mtime_ns)).encode()).hexdigest()[:12]
+            last_modified = _last_modified(list(file_signature) + [(dir_mtime_ns,)])
+            request._catalog_version = etag, last_modified
+    return request._catalog_version
+
+
+def _catalog_etag(request, *args, **kwargs):
+    version = _catalog_version(request)
+    return version and version[0]
+
+
+def _catalog_last_modified(request, *args, **kwargs):
+    version = _catalog_version(request)
+    return version and version[1]
+
+
+def _export_etag(request, file_type, *args, **kwargs):
+    # Слабый: одна версия отдаётся и сжатой, и как есть (Vary: Accept-Encoding)
+    return f'W/"{file_type}-{ExportManager.catalog_version()}"'
+
+
+def _export_last_modified(request, *args, **kwargs):
+    return _last_modified(ParsedFileCache.signature())
+
+
+def _revalidate(view):
+    # no-cache: браузер и прокси хранят ответ, но каждый раз проверяют его по ETag
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        patch_cache_control(response, no_cache=True)
+        return response
+    return wrapper
+
+
+def catalog_condition(view):
+    """Условный GET для страниц каталога: 304, пока каталог не менялся"""
+    return _revalidate(condition(etag_func=_catalog_etag, last_modified_func=_catalog_last_modified)(view))
+
+
+def export_condition(view):
+    """Условный GET для скачивания экспорта: версия - как у файлов ExportManager"""
+    return _revalidate(condition(etag_func=_export_etag, last_modified_func=_export_last_modified)(view))
@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from .stats import CatalogStats
+
+
+def catalog_stats(request):
+    """Статистика каталога в шаблонах; читается из кэша, только если шаблон её использует"""
+    return {'catalog_stats': SimpleLazyObject(CatalogStats.get)}
@@ -0,0 +1,160 @@
+"""PostgreSQL с пулом соединений внутри процесса: ENGINE = 'books.db_pool'.
+
+Django закрывает соединение в конце запроса (CONN_MAX_AGE = 0), а этот бэкенд
+вместо закрытия возвращает его в пул. Пул общий для всех потоков процесса
+(запросы, потоки поиска, воркеры run_jobs), размер задаётся на процесс:
+
+    'POOL': {'SIZE': 10, 'TIMEOUT': 10}
+
+SIZE - сколько соединений процесс может держать открытыми, TIMEOUT - сколько
+секунд ждать свободного соединения. Время ожидания попадает в метрику
+books_db_pool_wait_seconds.
+"""
+import os
+import threading
+import time
+
+from django.db import OperationalError
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from books import metrics
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_POOL_TIMEOUT = 10
+
+
+class PoolTimeout(OperationalError):
+    """За TIMEOUT секунд не освободилось ни одного соединения"""
+
+
+class ConnectionPool:
+    def __init__(self, alias, size, timeout):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []  # свободные открытые соединения; берём последнее (оно «теплее»)
+
+    def acquire(self, connect, health_check=False):
+        """Соединение из пула или новое (connect()); ждёт не дольше timeout"""
+        started = time.perf_counter()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        if metrics.is_enabled():
+            metrics.registry.observe('books_db_pool_wait_seconds', time.perf_counter() - started, alias=self.alias)
+        if not acquired:
+            if metrics.is_enabled():
+                metrics.registry.inc('books_db_pool_timeouts_total', alias=self.alias)
+            raise PoolTimeout(f'Нет свободного соединения с БД за {self.timeout} с (пул на {self.size})')
+
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return connect()
+                if not connection.closed and (not health_check or _is_usable(connection)):
+                    return connection
+                # Соединение оборвалось, пока лежало в пуле (рестарт PostgreSQL, таймаут)
+                _close_quietly(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection):
+        try:
+            if connection.closed:
+                return
+            try:
+                # Незавершённая транзакция не должна достаться следующему запросу
+                connection.rollback()
+            except Exception:
+                _close_quietly(connection)
+                return
+            with self._lock:
+                self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            _close_quietly(connection)
+
+
+def _is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Exception:
+        return False
+    return True
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict, conn_params):
+    # После fork (gunicorn --preload) соединения родителя не используем - у процесса свой пул.
+    # Параметры подключения - в ключе: тестовая БД получает свой пул, а не соединения к рабочей
+    key = (alias, os.getpid(), repr(sorted(conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = settings_dict.get('POOL') or {}
+            pool = ConnectionPool(
+                alias,
+                size=int(options.get('SIZE', DEFAULT_POOL_SIZE)),
+                timeout=float(options.get('TIMEOUT', DEFAULT_POOL_TIMEOUT)),
+            )
+            _pools[key] = pool
+        return pool
+
+
+def close_pools(alias):
+    """Закрывает свободные соединения всех пулов alias - иначе DROP DATABASE ждёт их"""
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[0] == alias]
+    for pool in pools:
+        pool.close_all()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        # Шаблон для CREATE DATABASE ... TEMPLATE не должен иметь открытых соединений
+        close_pools(self.connection.alias)
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    _pool = None
+
+    def get_new_connection(self, conn_params):
+        pool = self._pool = get_pool(self.alias, self.settings_dict, conn_params)
+        connection = pool.acquire(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            health_check=self.settings_dict['CONN_HEALTH_CHECKS'],
+        )
+        # Для соединения из пула base.DatabaseWrapper.get_new_connection не вызывался
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = IsolationLevel.READ_COMMITTED if isolation_level is None else IsolationLevel(isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            self._pool.release(self.connection)
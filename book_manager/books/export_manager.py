@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import time
+
+from django.conf import settings
+
+from .exporters import iter_file, tee_to_file
+from .utils import FileHandler, books_file_cache, data_file_written
+
+# Все сохранённые экспорты называются books_export_<версия>.<формат>
+EXPORT_PREFIX = 'books_export_'
+
+# Индекс экспортов в DATA_ROOT: имя файла -> формат, версия каталога, время, размер
+EXPORT_INDEX_NAME = 'exports.index'
+
+# Недописанные .tmp старше этого (в секундах) считаются брошенными
+STALE_TMP_AGE = 60 * 60
+
+
+class ExportManager:
+    """Экспорты в DATA_ROOT с именами по версии каталога.
+
+    Пока каталог не менялся, повторный экспорт отдаёт уже готовый файл вместо
+    новой выгрузки из БД. Старые экспорты удаляются по количеству, возрасту
+    и общему размеру (BOOKS_EXPORTS_MAX_*).
+    """
+
+    @staticmethod
+    def catalog_version():
+        # Любое изменение книг (из БД или только в файл) попадает в books.json или журнал
+        return hashlib.md5(repr(books_file_cache.signature()).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def artifact_path(file_format, version):
+        return FileHandler.get_export_path(file_format, version)
+
+    @staticmethod
+    def export(file_format, build):
+        """(путь к файлу, куски для ответа): готовый экспорт текущей версии или новый из build()"""
+        version = ExportManager.catalog_version()
+        file_path = ExportManager.artifact_path(file_format, version)
+        if os.path.isfile(file_path):
+            return file_path, iter_file(file_path)
+        return file_path, ExportManager._generate(build(), file_format, file_path, version)
+
+    @staticmethod
+    def _generate(chunks, file_format, file_path, version):
+        yield from tee_to_file(chunks, file_path)
+
+        if ExportManager.catalog_version() != version:
+            # Каталог менялся во время выгрузки - файл не соответствует своей версии
+            ExportManager._remove(file_path)
+            return
+
+        with FileHandler._locked():
+            index = ExportManager.read_index()
+            index[os.path.basename(file_path)] = {
+                'format': file_format,
+                'version': version,
+                'created': time.time(),
+                'size': os.path.getsize(file_path),
+            }
+            ExportManager._write_index(index)
+        ExportManager.cleanup(keep=(os.path.basename(file_path),))
+
+    @staticmethod
+    def cleanup(now=None, keep=(), max_count=None, max_age=None, max_bytes=None):
+        """Удаляет экспорты сверх лимитов (сначала самые старые) и брошенные .tmp.
+
+        Возвращает имена удалённых файлов.
+        """
+        now = now or time.time()
+        max_count = settings.BOOKS_EXPORTS_MAX_COUNT if max_count is None else max_count
+        max_age = settings.BOOKS_EXPORTS_MAX_AGE if max_age is None else max_age
+        max_bytes = settings.BOOKS_EXPORTS_MAX_BYTES if max_bytes is None else max_bytes
+        removed = []
+
+        with FileHandler._locked():
+            index = ExportManager.read_index()
+            artifacts = []
+            with os.scandir(FileHandler.get_data_path()) as entries:
+                for entry in entries:
+                    if not entry.name.startswith(EXPORT_PREFIX) or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    if entry.name.endswith('.tmp'):
+                        if now - stat.st_mtime > STALE_TMP_AGE:
+                            ExportManager._remove(entry.path)
+                            removed.append(entry.name)
+                        continue
+                    # Файлы без записи в индексе (старые экспорты с uuid) - по mtime
+                    created = index.get(entry.name, {}).get('created', stat.st_mtime)
+                    artifacts.append((created, entry.name, entry.path, stat.st_size))
+
+            total = 0
+            kept = {}
+            for position, (created, name, path, size) in enumerate(sorted(artifacts, reverse=True)):
+                total += size
+                expired = (
+                    position >= max_count
+                    or now - created > max_age
+                    or total > max_bytes
+                )
+                if expired and name not in keep:
+                    ExportManager._remove(path)
+                    removed.append(name)
+                    total -= size
+                else:
+                    kept[name] = index.get(name, {'created': created, 'size': size})
+
+            if kept != index:
+                ExportManager._write_index(kept)
+        return removed
+
+    @staticmethod
+    def get_index_path():
+        return os.path.join(FileHandler.get_data_path(), EXPORT_INDEX_NAME)
+
+    @staticmethod
+    def read_index():
+        try:
+            with open(ExportManager.get_index_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_index(index):
+        index_path = ExportManager.get_index_path()
+        tmp_path = f'{index_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, index_path)
+
+    @staticmethod
+    def _remove(file_path):
+        before = FileHandler.data_signature()
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            return
+        data_file_written.send(sender=FileHandler, path=file_path, before=before)
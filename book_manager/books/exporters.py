@@ -0,0 +1,178 @@
+import json
+import os
+import re
+import uuid
+from xml.sax.saxutils import escape
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from .models import Book
+from .utils import FileHandler, data_file_written
+
+# Поля, которые попадают в экспорт XML
+XML_EXPORT_FIELDS = ('title', 'author', 'isbn', 'publication_year', 'genre', 'langua', 'page_count', 'description')
+
+# Поля JSON-экспорта - те же, что в books.json
+JSON_EXPORT_FIELDS = (
+    'id', 'title', 'author', 'isbn', 'publication_year', 'genre',
+    'langua', 'page_count', 'description', 'created_at',
+)
+
+# Сколько строк БД читается за раз и сколько книг уходит клиенту одним куском
+EXPORT_CHUNK_SIZE = 2000
+
+
+_XML_ENTITIES = {'"': '&quot;'}
+
+
+def _xml_element(field, value, indent, newline):
+    # Как в прежнем экспорте через minidom: пустое поле - <field/>, кавычки экранируются,
+    # а \r, как и при разборе XML, становится \n
+    text = str(value).replace('\r\n', '\n').replace('\r', '\n')
+    if not text:
+        return f'{indent}<{field}/>{newline}'
+    return f'{indent}<{field}>{escape(text, _XML_ENTITIES)}</{field}>{newline}'
+
+
+def iter_xml_export(indent='  ', chunk_size=EXPORT_CHUNK_SIZE):
+    """Отдаёт XML-экспорт кусками байтов, не собирая документ в памяти.
+
+    С отступом по умолчанию результат побайтно совпадает с прежним
+    ElementTree + minidom.toprettyxml(indent='  ')
+    """
+    newline = '\n' if indent else ''
+    book_indent = indent or ''
+    field_indent = book_indent * 2
+
+    yield f'<?xml version="1.0" ?>{newline}'.encode('utf-8')
+
+    parts = []
+    count = 0
+    rows = Book.objects.values_list(*XML_EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    for count, row in enumerate(rows, start=1):
+        if count == 1:
+            parts.append(f'<books>{newline}')
+        parts.append(f'{book_indent}<book>{newline}')
+        for field, value in zip(XML_EXPORT_FIELDS, row):
+            if value is not None:
+                parts.append(_xml_element(field, value, field_indent, newline))
+        parts.append(f'{book_indent}</book>{newline}')
+
+        if count % chunk_size == 0:
+            yield ''.join(parts).encode('utf-8')
+            parts = []
+
+    parts.append(f'</books>{newline}' if count else f'<books/>{newline}')
+    yield ''.join(parts).encode('utf-8')
+
+
+def iter_json_export(lines=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Отдаёт книги JSON-массивом или NDJSON (lines=True) прямо из выборки values()"""
+    rows = Book.objects.values(*JSON_EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+    parts = [] if lines else ['[']
+    for count, row in enumerate(rows, start=1):
+        row['created_at'] = row['created_at'].isoformat()
+        if lines:
+            parts.append(json.dumps(row, ensure_ascii=False) + '\n')
+        else:
+            parts.append(('\n' if count == 1 else ',\n') + json.dumps(row, ensure_ascii=False))
+
+        if count % chunk_size == 0:
+            yield ''.join(parts).encode('utf-8')
+            parts = []
+
+    if not lines:
+        parts.append('\n]\n')
+    yield ''.join(parts).encode('utf-8')
+
+
+_GZIP_RE = re.compile(r'\bgzip\b')
+
+
+def export_response(request, chunks, content_type, filename):
+    """Потоковый ответ с файлом; сжимается gzip, если клиент это поддерживает"""
+    accepts_gzip = _GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if accepts_gzip:
+        chunks = compress_sequence(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if accepts_gzip:
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def iter_file(file_path, chunk_size=EXPORT_CHUNK_SIZE * 32):
+    """Готовый файл кусками - для StreamingHttpResponse"""
+    return _read_range(file_path, 0, os.path.getsize(file_path), chunk_size)
+
+
+def _read_range(file_path, start, length, chunk_size=EXPORT_CHUNK_SIZE * 32):
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(request, file_path, content_type):
+    """Отдаёт файл потоком; поддерживает один диапазон из заголовка Range (ответ 206)"""
+    size = os.path.getsize(file_path)
+    start, end = 0, size - 1
+    status = 200
+
+    match = _RANGE_RE.match(request.headers.get('Range', '').strip())
+    if match and any(match.groups()):
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # bytes=-N - последние N байт
+            start = max(size - int(last), 0)
+        if start > end or start >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        status = 206
+
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(_read_range(file_path, start, length), content_type=content_type, status=status)
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def tee_to_file(chunks, file_path):
+    """Пропускает куски дальше и одновременно пишет их в файл.
+
+    Файл появляется под своим именем только после полной записи; если клиент
+    оборвал загрузку, недописанная копия удаляется.
+    """
+    # У каждой записи свой .tmp: один и тот же экспорт могут собирать два запроса сразу
+    tmp_path = f'{file_path}.{uuid.uuid4().hex[:8]}.tmp'
+    before = FileHandler.data_signature()
+    completed = False
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp_path, file_path)
+        completed = True
+        data_file_written.send(sender=FileHandler, path=file_path, before=before)
+    finally:
+        if not completed and os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,70 @@
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+# Длины n-грамм в индексе: биграммы нужны для запросов из двух символов
+NGRAM_SIZES = (2, 3)
+
+
+def _ngrams(text, sizes=NGRAM_SIZES):
+    grams = set()
+    for n in sizes:
+        grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+def _contains(postings, position):
+    i = bisect_left(postings, position)
+    return i < len(postings) and postings[i] == position
+
+
+class NgramIndex:
+    """Инвертированный индекс по n-граммам названия и автора книг из файла.
+
+    Номера в списках вхождений - позиции в records, списки отсортированы,
+    поэтому пересечение делается бинарным поиском без перебора всех книг.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        # Название и автор через перевод строки, чтобы n-граммы не склеивали поля
+        self.texts = [f'{record.title}\n{record.author}'.lower() for record in records]
+
+        postings = defaultdict(list)
+        for position, text in enumerate(self.texts):
+            title, author = text.split('\n', 1)
+            for gram in _ngrams(title) | _ngrams(author):
+                postings[gram].append(position)
+        self.postings = {gram: array('I', positions) for gram, positions in postings.items()}
+
+    def search(self, query, limit=None, newest_first=False):
+        """Позиции книг, у которых query входит в название или автора"""
+        query = query.lower()
+        if len(query) < 2:
+            # Для одного символа индекса нет - просматриваем все книги
+            positions = range(len(self.texts))
+            return self._take(reversed(positions) if newest_first else positions, query, limit)
+
+        grams = _ngrams(query, sizes=(3,)) if len(query) >= 3 else {query}
+        lists = []
+        for gram in grams:
+            postings = self.postings.get(gram)
+            if postings is None:
+                return []
+            lists.append(postings)
+        lists.sort(key=len)
+
+        smallest, others = lists[0], lists[1:]
+        candidates = reversed(smallest) if newest_first else iter(smallest)
+        positions = (i for i in candidates if all(_contains(other, i) for other in others))
+        return self._take(positions, query, limit)
+
+    def _take(self, positions, query, limit):
+        # Совпадение всех n-грамм ещё не значит совпадение подстроки - проверяем текст
+        found = []
+        for position in positions:
+            if query in self.texts[position]:
+                found.append(position)
+                if limit is not None and len(found) >= limit:
+                    break
+        return found
@@ -0,0 +1,232 @@
+import codecs
+import json
+import re
+import xml.etree.ElementTree as ET
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, transaction
+
+from .models import Book, book_fingerprint, validate_isbn, validate_publication_year
+from .snapshot import CatalogSnapshot
+from .stats import book_stats_values
+from .utils import FileHandler
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+GENRE_CODES = {code for code, _ in Book.GENRE_CHOICES}
+
+# Сколько книг вставляется одним INSERT и одной транзакцией
+IMPORT_BATCH_SIZE = 1000
+
+# Сколько ошибок показываем пользователю
+MAX_REPORTED_ERRORS = 10
+
+_BLANKS = re.compile(r'\s*')
+_SEPARATORS = re.compile(r'[\s,]*')
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.errors = []  # (номер записи, текст ошибки)
+
+    def add_error(self, row, message):
+        self.errors.append((row, message))
+
+
+def iter_json_books(fileobj, chunk_size=64 * 1024):
+    """Потоково читает JSON-массив книг, не загружая файл целиком"""
+    if ijson is not None:
+        yield from ijson.items(fileobj, 'item')
+        return
+
+    # Без ijson: разбираем массив по одному объекту через raw_decode
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, pos, eof, started = '', 0, False, False
+
+    while True:
+        pos = (_SEPARATORS if started else _BLANKS).match(buffer, pos).end()
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('Ожидался JSON-массив книг')
+                started, pos = True, pos + 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Объект не поместился в буфер - дочитываем следующий кусок
+            else:
+                pos = end
+                yield obj
+                continue
+        elif eof:
+            raise ValueError('Неожиданный конец JSON-файла')
+
+        chunk = fileobj.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + text_decoder.decode(chunk, final=eof), 0
+
+
+def iter_xml_books(fileobj):
+    """Потоково читает <books><book>...</book></books>, освобождая разобранные элементы"""
+    context = ET.iterparse(fileobj, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event == 'end' and elem.tag == 'book':
+            yield {child.tag: child.text for child in elem}
+            root.clear()
+
+
+def _optional_int(value):
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def _text(data, field, default=None):
+    # В JSON в поле может оказаться что угодно - список, объект, число
+    value = data.get(field, default)
+    if value is not None and not isinstance(value, str):
+        raise ValidationError(f'поле {field} должно быть строкой')
+    return value
+
+
+def build_book(data):
+    """Проверяет запись из файла и создаёт несохранённый Book.
+
+    Значения приводятся к типам полей модели (clean_fields), поэтому то, что
+    попадает в журнал books.json, совпадает с тем, что сохранит БД
+    """
+    if not isinstance(data, dict):
+        raise ValidationError('запись должна быть объектом')
+
+    title = (_text(data, 'title') or '').strip()
+    author = (_text(data, 'author') or '').strip()
+    if not title or not author:
+        raise ValidationError('не указаны название или автор')
+    if len(title) > 200 or len(author) > 100:
+        raise ValidationError('слишком длинное название или имя автора')
+
+    try:
+        publication_year = int(data['publication_year'])
+        page_count = _optional_int(data.get('page_count'))
+    except (KeyError, TypeError, ValueError):
+        raise ValidationError('год издания и количество страниц должны быть числами')
+    validate_publication_year(publication_year)
+
+    isbn = _text(data, 'isbn') or ''
+    validate_isbn(isbn)
+
+    genre = data.get('genre') or 'other'
+    if genre not in GENRE_CODES:
+        raise ValidationError(f'неизвестный жанр "{genre}"')
+
+    book = Book(
+        title=title,
+        author=author,
+        isbn=isbn,
+        publication_year=publication_year,
+        genre=genre,
+        langua=_text(data, 'langua', 'Русский'),
+        page_count=page_count,
+        description=_text(data, 'description', ''),
+    )
+    try:
+        # Длины строк и диапазоны чисел - те же, что у столбцов в БД
+        book.clean_fields(exclude=['fingerprint'])
+    except ValidationError as e:
+        raise ValidationError([f'{field}: {message}' for field, messages in e.message_dict.items() for message in messages])
+    return book
+
+
+def import_books(fileobj, file_type, batch_size=IMPORT_BATCH_SIZE, on_batch=None):
+    """Импортирует книги пакетами: bulk_create и отдельная транзакция на пакет.
+
+    on_batch(result) вызывается после каждого сохранённого пакета - для прогресса
+    """
+    records = iter_json_books(fileobj) if file_type == 'json' else iter_xml_books(fileobj)
+    result = ImportResult()
+    batch = []
+
+    for row, data in enumerate(records, start=1):
+        try:
+            batch.append((row, build_book(data)))
+        except ValidationError as e:
+            result.add_error(row, '; '.join(e.messages))
+            continue
+
+        if len(batch) >= batch_size:
+            result.imported += _save_batch(batch, result)
+            batch = []
+            if on_batch is not None:
+                on_batch(result)
+
+    if batch:
+        result.imported += _save_batch(batch, result)
+    return result
+
+
+def find_duplicates(books):
+    """Номера книг в списке, которые уже есть в БД или повторяют книгу выше по списку.
+
+    Весь список проверяется одним запросом по уникальному индексу fingerprint.
+    """
+    fingerprints = [book_fingerprint(book.title, book.author, book.publication_year) for book in books]
+    known = set(Book.objects.filter(fingerprint__in=fingerprints).values_list('fingerprint', flat=True))
+    duplicates = set()
+    for i, fingerprint in enumerate(fingerprints):
+        if fingerprint in known:
+            duplicates.add(i)
+        known.add(fingerprint)
+    return duplicates
+
+
+def load_missing_ids(books):
+    """Проставляет id книгам после bulk_create, если СУБД их не вернула.
+
+    Книги находятся по уникальному fingerprint. Если какой-то книги нет, это
+    DatabaseError: без id её нельзя записать в журнал, а пересобирать books.json
+    из БД нельзя - пропали бы книги, которые есть только в файле
+    """
+    missing = {book.fingerprint: book for book in books if book.pk is None}
+    if not missing:
+        return
+    for fingerprint, pk in Book.objects.filter(fingerprint__in=list(missing)).values_list('fingerprint', 'pk'):
+        missing.pop(fingerprint).pk = pk
+    if missing:
+        raise DatabaseError(f'СУБД не вернула id {len(missing)} новых книг')
+
+
+def _save_batch(batch, result):
+    """batch - [(номер записи, Book)]; дубликаты пропускаются и попадают в ошибки"""
+    for attempt in (1, 2):
+        duplicates = find_duplicates([book for _, book in batch])
+        new_books = [book for i, (_, book) in enumerate(batch) if i not in duplicates]
+        try:
+            with transaction.atomic():
+                books = Book.objects.bulk_create(new_books)
+                load_missing_ids(books)
+        except IntegrityError:
+            # Такую же книгу только что сохранил другой запрос - проверяем пакет ещё раз
+            if attempt == 2:
+                raise
+            continue
+        break
+
+    # bulk_create не отправляет post_save, поэтому журналим пакет одной записью в файл
+    entries = [{'op': 'insert', 'book': FileHandler.book_to_dict(book)} for book in books]
+    changes = [(('db', 'file'), None, book_stats_values(book)) for book in books]
+    transaction.on_commit(lambda: CatalogSnapshot.record(entries, changes))
+
+    for i in sorted(duplicates):
+        result.add_error(batch[i][0], 'такая книга уже есть в каталоге')
+    return len(books)
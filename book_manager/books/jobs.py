@@ -0,0 +1,154 @@
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .export_manager import ExportManager
+from .exporters import iter_json_export, iter_xml_export
+from .importers import MAX_REPORTED_ERRORS, import_books
+from .models import Job
+from .utils import FileHandler
+
+# Форматы экспорта: расширение файла, генератор кусков и Content-Type для скачивания
+EXPORT_FORMATS = {
+    'json': ('json', iter_json_export, 'application/json'),
+    'ndjson': ('ndjson', lambda: iter_json_export(lines=True), 'application/x-ndjson'),
+    'xml': ('xml', iter_xml_export, 'application/xml'),
+}
+
+# Прогресс пишется в БД не чаще раза в столько секунд
+PROGRESS_INTERVAL = 1.0
+
+
+def get_jobs_path():
+    # Загруженные файлы ждут импорта здесь; в списке файлов DATA_ROOT их не видно
+    jobs_dir = os.path.join(FileHandler.get_data_path(), 'jobs')
+    os.makedirs(jobs_dir, exist_ok=True)
+    return jobs_dir
+
+
+def enqueue_import(uploaded_file, file_type):
+    """Сохраняет загруженный файл на диск и ставит его импорт в очередь"""
+    file_path = os.path.join(get_jobs_path(), f'{uuid.uuid4().hex}.{file_type}')
+    with open(file_path, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+    return Job.objects.create(
+        kind=Job.KIND_IMPORT,
+        params={'path': file_path, 'file_type': file_type, 'name': uploaded_file.name},
+        total=uploaded_file.size,
+    )
+
+
+def enqueue_export(file_format):
+    return Job.objects.create(kind=Job.KIND_EXPORT, params={'format': file_format})
+
+
+def claim_job(worker):
+    """Берёт следующую задачу из очереди или None.
+
+    Задачу может взять только один воркер: UPDATE ... WHERE status = 'pending'
+    изменит строку лишь у того, кто успел первым. Зависший экспорт (воркер
+    упал, прогресс давно не обновлялся) запускается заново, а зависший импорт
+    помечается ошибкой - повтор сохранил бы часть книг второй раз.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.BOOKS_JOBS_STALE_AFTER)
+    stale_imports = Q(kind=Job.KIND_IMPORT, status=Job.STATUS_RUNNING, updated_at__lt=stale)
+    for job in Job.objects.filter(stale_imports).only('params'):
+        failed = Job.objects.filter(stale_imports, pk=job.pk).update(
+            status=Job.STATUS_FAILED, finished_at=now, updated_at=now,
+            message='Воркер остановился во время импорта; часть книг могла сохраниться',
+        )
+        if failed:
+            # Файл больше никто не импортирует - иначе загрузки копились бы в DATA_ROOT/jobs
+            _remove_upload(job)
+    claimable = Q(status=Job.STATUS_PENDING) | Q(kind=Job.KIND_EXPORT, status=Job.STATUS_RUNNING, updated_at__lt=stale)
+
+    candidates = Job.objects.filter(claimable).order_by('created_at', 'id').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        claimed = Job.objects.filter(claimable, pk=job_id).update(
+            status=Job.STATUS_RUNNING, worker=worker, started_at=now, updated_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def _remove_upload(job):
+    try:
+        os.remove(job.params['path'])
+    except FileNotFoundError:
+        pass
+
+
+def _update(job, **fields):
+    # Пишем, только пока задача за этим воркером - её могли перезабрать как зависшую
+    fields['updated_at'] = timezone.now()
+    return Job.objects.filter(pk=job.pk, worker=job.worker).update(**fields)
+
+
+class ProgressReporter:
+    def __init__(self, job):
+        self.job = job
+        self.reported_at = 0
+
+    def __call__(self, progress, force=False):
+        now = time.monotonic()
+        if force or now - self.reported_at >= PROGRESS_INTERVAL:
+            self.reported_at = now
+            _update(self.job, progress=progress)
+
+
+def run_job(job):
+    handler = JOB_HANDLERS[job.kind]
+    try:
+        fields = handler(job)
+    except Exception as e:
+        _update(job, status=Job.STATUS_FAILED, message=f'Ошибка: {e}', finished_at=timezone.now())
+    else:
+        _update(job, status=Job.STATUS_DONE, finished_at=timezone.now(), **fields)
+    finally:
+        close_old_connections()
+
+
+def _run_import(job):
+    file_path = job.params['path']
+    report = ProgressReporter(job)
+    try:
+        with open(file_path, 'rb') as f:
+            result = import_books(f, job.params['file_type'], on_batch=lambda result: report(f.tell()))
+    finally:
+        _remove_upload(job)
+
+    message = f'Импортировано {result.imported} книг!'
+    if result.errors:
+        details = '; '.join(f'запись {row}: {error}' for row, error in result.errors[:MAX_REPORTED_ERRORS])
+        message += f' Пропущено записей с ошибками: {len(result.errors)} ({details})'
+    return {'progress': job.total or 0, 'message': message}
+
+
+def _run_export(job):
+    extension, build, _ = EXPORT_FORMATS[job.params['format']]
+    report = ProgressReporter(job)
+
+    file_path, chunks = ExportManager.export(extension, build)
+    written = 0
+    for chunk in chunks:
+        written += len(chunk)
+        report(written)
+
+    if not os.path.exists(file_path):
+        raise RuntimeError('каталог изменился во время экспорта, запустите экспорт ещё раз')
+    return {'progress': written, 'total': written, 'result_path': file_path, 'message': f'Файл {os.path.basename(file_path)} готов'}
+
+
+JOB_HANDLERS = {
+    Job.KIND_IMPORT: _run_import,
+    Job.KIND_EXPORT: _run_export,
+}
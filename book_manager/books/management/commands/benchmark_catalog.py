@@ -0,0 +1,185 @@
+import json
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from books.models import Book
+from books.pagination import KeysetPage
+from books.seed import seed_db, seed_file
+from books.utils import FileHandler, books_file_cache
+
+AJAX = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+# Доля книг, которые есть только в books.json
+FILE_ONLY_SHARE = 0.1
+
+# Строк в странице для замера отрисовки шаблона списка
+RENDER_ROWS = 100
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет ключевые страницы и методы FileHandler на сгенерированных каталогах разного размера. '
+        'Работает на тестовой БД и во временном DATA_ROOT; результаты сохраняются в JSON '
+        'и могут сравниваться с эталоном'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,100000', help='Размеры каталога через запятую, например 1000,100000,1000000')
+        parser.add_argument('--repeat', type=int, default=5, help='Сколько раз повторять каждый замер')
+        parser.add_argument('--output', default='benchmark_results.json', help='Куда сохранить результаты')
+        parser.add_argument('--baseline', help='Файл с эталонными результатами для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.25, help='Допустимое замедление относительно эталона (0.25 = 25%%)')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Меньшие разницы во времени считаются шумом')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as data_root, override_settings(
+                DATA_ROOT=data_root, BOOKS_SNAPSHOT_DELAY=0, BOOKS_BACKGROUND_JOBS=False,
+            ):
+                results = {str(size): self.run_size(size, options['repeat']) for size in sizes}
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'vendor': connection.vendor,
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(f"Результаты сохранены в {options['output']}")
+
+        if baseline is not None:
+            self.compare(results, baseline['results'], options['threshold'], options['min_delta_ms'])
+
+    def run_size(self, size, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Каталог: {size} книг'))
+        self.reset()
+
+        started = time.perf_counter()
+        file_only = int(size * FILE_ONLY_SHARE)
+        seed_db(size - file_only)
+        seed_file(file_only, seed=43)
+        self.stdout.write(f'Сгенерирован за {time.perf_counter() - started:.1f} с')
+
+        results = {}
+        for name, (setup, run) in self.cases().items():
+            timings = []
+            for _ in range(repeat):
+                setup()
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = {'median_ms': statistics.median(timings), 'min_ms': min(timings)}
+            self.stdout.write(f"{name:<24} медиана {results[name]['median_ms']:9.2f} мс   лучшее {results[name]['min_ms']:9.2f} мс")
+        return results
+
+    def reset(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM books_book')
+        open(FileHandler.get_json_file_path(), 'w').write('[]')
+        open(FileHandler.get_journal_file_path(), 'w').close()
+        for alias in ('default', 'search', 'template_fragments'):
+            caches[alias].clear()
+        books_file_cache.clear()
+
+    def cases(self):
+        client = Client()
+        queries = iter(['са', 'сад', 'the', 'город', 'мор', 'wind', 'тёмный', 'ов'] * 1000)
+
+        def get(path, params=None, **extra):
+            def run():
+                response = client.get(path, params or {}, **extra)
+                if response.status_code != 200:
+                    raise CommandError(f'{path}: код ответа {response.status_code}')
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+            return run
+
+        def export(file_type):
+            def run():
+                response = client.post('/export/', {'file_type': file_type})
+                for _ in response.streaming_content:
+                    pass
+            return run
+
+        def search():
+            response = client.get('/search/ajax/', {'q': next(queries)}, **AJAX)
+            if response.status_code != 200:
+                raise CommandError(f'/search/ajax/: код ответа {response.status_code}')
+
+        def render_book_list(source):
+            # Только шаблон: книги выбраны заранее, без запроса и middleware
+            if source == 'db':
+                books = list(Book.objects.order_by('-created_at', '-id')[:RENDER_ROWS])
+            else:
+                books = FileHandler.load_books_sorted()[0][-RENDER_ROWS:][::-1]
+            context = {'page': 'book_list', 'page_obj': KeysetPage(books), 'paging': 'cursor', 'current_source': source}
+            return lambda: render_to_string('books/book_list.html', context)
+
+        nothing = lambda: None  # noqa: E731
+        clear_fragments = lambda: caches['template_fragments'].clear()  # noqa: E731
+        clear_search = lambda: caches['search'].clear()  # noqa: E731
+        clear_files = books_file_cache.clear
+
+        return {
+            'home': (nothing, get('/')),
+            'book_list_db': (nothing, get('/books/')),
+            'book_list_db_pages': (nothing, get('/books/', {'paging': 'pages', 'page': 5})),
+            'book_list_db_query': (nothing, get('/books/', {'q': 'сад'})),
+            'book_list_file': (nothing, get('/books/', {'source': 'file'})),
+            'book_list_file_query': (nothing, get('/books/', {'source': 'file', 'q': 'сад'})),
+            'book_list_rows_cold': (clear_fragments, get('/books/')),
+            'render_list_db_cold': (clear_fragments, render_book_list('db')),
+            'render_list_db_warm': (nothing, render_book_list('db')),
+            'render_list_file_cold': (clear_fragments, render_book_list('file')),
+            'render_list_file_warm': (nothing, render_book_list('file')),
+            'search_ajax': (clear_search, search),
+            'export_json': (nothing, export('json')),
+            'file_list': (nothing, get('/files/')),
+            'file_read_books': (nothing, FileHandler._read_books),
+            'file_load_cold': (clear_files, FileHandler.load_book_records),
+            'file_load_warm': (nothing, FileHandler.load_book_records),
+            'file_index_cold': (clear_files, FileHandler.load_search_index),
+        }
+
+    def compare(self, results, baseline, threshold, min_delta_ms):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Сравнение с эталоном (допуск {threshold:.0%})'))
+        regressions = []
+        for size, cases in results.items():
+            for name, current in cases.items():
+                base = baseline.get(size, {}).get(name)
+                if base is None:
+                    continue
+                ratio = current['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+                slower = ratio > 1 + threshold and current['median_ms'] - base['median_ms'] > min_delta_ms
+                line = f"{size:>8} {name:<24} {base['median_ms']:9.2f} -> {current['median_ms']:9.2f} мс  x{ratio:.2f}"
+                if slower:
+                    regressions.append(line)
+                    self.stdout.write(self.style.ERROR(line))
+                else:
+                    self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f'Замедление больше допуска: {len(regressions)} замеров')
+        self.stdout.write(self.style.SUCCESS('Замедлений сверх допуска нет'))
@@ -0,0 +1,159 @@
+import itertools
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from books.models import Book
+from books.seed import generate_books
+
+BENCH_TABLE = 'books_book_bench'
+
+
+def clone_field(field, **changes):
+    name, path, args, kwargs = field.deconstruct()
+    return field.__class__(*args, **{**kwargs, **changes})
+
+
+def make_bench_model():
+    """Копия модели Book в отдельной таблице, без индексов из Meta и без уникального fingerprint"""
+    attrs = {'__module__': 'books.models'}
+    for field in Book._meta.local_fields:
+        if field.name == 'created_at':
+            clone = clone_field(field, auto_now_add=False)  # даты задаём сами, чтобы порядок был реалистичным
+        elif field.name == 'fingerprint':
+            clone = clone_field(field, unique=False)  # иначе «без индексов» уже был бы индекс UNIQUE
+        else:
+            clone = field.clone()
+        attrs[field.name] = clone
+    attrs['Meta'] = type('Meta', (), {'app_label': 'books', 'db_table': BENCH_TABLE})
+    return type('BenchBook', (models.Model,), attrs)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает планы и время горячих запросов к книгам без индексов и с индексами. '
+        'Работает на отдельной тестовой БД, рабочая база не затрагивается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Сколько книг сгенерировать')
+        parser.add_argument('--batch', type=int, default=10_000, help='Размер пакета bulk_create')
+        parser.add_argument('--repeat', type=int, default=5, help='Сколько раз повторять каждый запрос')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовую БД с таблицей после замера')
+
+    def handle(self, *args, **options):
+        # До миллиона строк - только в тестовую БД (test_<имя>), как в benchmark_catalog
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keep'])
+        try:
+            self.stdout.write(f"База для замера: {connection.settings_dict['NAME']}")
+            self.run_benchmark(options)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keep'])
+            teardown_test_environment()
+
+    def run_benchmark(self, options):
+        BenchBook = make_bench_model()
+
+        with connection.schema_editor() as editor:
+            editor.execute(f'DROP TABLE IF EXISTS {BENCH_TABLE}')
+            editor.create_model(BenchBook)
+
+        try:
+            self.seed(BenchBook, options['rows'], options['batch'])
+            sample = BenchBook.objects.order_by('?').values('fingerprint').first()
+            queries = self.hot_queries(BenchBook, sample)
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Без индексов'))
+            before = self.measure(queries, options['repeat'])
+
+            started = time.perf_counter()
+            with connection.schema_editor() as editor:
+                for index in Book._meta.indexes:
+                    bench_index = index.clone()
+                    bench_index.name = f'bench_{index.name}'[:30]
+                    editor.add_index(BenchBook, bench_index)
+                # Уникальный индекс отпечатка, как у Book
+                old_field = BenchBook._meta.get_field('fingerprint')
+                new_field = clone_field(old_field, unique=True)
+                new_field.set_attributes_from_name('fingerprint')
+                new_field.model = BenchBook
+                editor.alter_field(BenchBook, old_field, new_field)
+            self.stdout.write(f'Индексы построены за {time.perf_counter() - started:.2f} с')
+
+            self.stdout.write(self.style.MIGRATE_HEADING('С индексами'))
+            after = self.measure(queries, options['repeat'])
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Итог (мс, лучшее из повторов)'))
+            for name in queries:
+                speedup = before[name] / after[name] if after[name] else float('inf')
+                self.stdout.write(f'{name:<24} {before[name]:>10.2f} {after[name]:>10.2f}   x{speedup:.1f}')
+        finally:
+            if not options['keep']:
+                with connection.schema_editor() as editor:
+                    editor.delete_model(BenchBook)
+
+    def seed(self, BenchBook, rows, batch):
+        books = generate_books(rows)
+        started = time.perf_counter()
+
+        for offset in range(0, rows, batch):
+            objs = []
+            for data in itertools.islice(books, batch):
+                data.pop('id')
+                data['created_at'] = datetime.fromisoformat(data['created_at'])
+                objs.append(BenchBook(**data))
+            with transaction.atomic():
+                BenchBook.objects.bulk_create(objs)
+
+        self.stdout.write(f'Сгенерировано {rows} книг за {time.perf_counter() - started:.1f} с')
+
+    def hot_queries(self, BenchBook, sample):
+        objects = BenchBook.objects
+        return {
+            # Первая страница book_list
+            'book_list': lambda: list(objects.order_by('-created_at', '-id')[:10]),
+            # Проверка дубликатов в add_book и при импорте (уникальный fingerprint)
+            'duplicate_check': lambda: objects.filter(**sample).exists(),
+            # Фильтры админки (сортировка по -created_at)
+            'admin_genre': lambda: list(objects.filter(genre='fantasy').order_by('-created_at')[:100]),
+            'admin_year': lambda: list(objects.filter(publication_year=1999).order_by('-created_at')[:100]),
+        }
+
+    def measure(self, queries, repeat):
+        results = {}
+        for name, run in queries.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = min(timings)
+
+            self.stdout.write(f'{name}: {results[name]:.2f} мс')
+            for line in self.explain(run).splitlines():
+                self.stdout.write(f'    {line}')
+        return results
+
+    def explain(self, run):
+        # Перехватываем SQL, который выполняет запрос, и спрашиваем у СУБД его план
+        capture = _Capture()
+        with connection.execute_wrapper(capture):
+            run()
+        sql, params = capture.queries[-1]
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+
+
+class _Capture:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, params))
+        return execute(sql, params, many, context)
@@ -0,0 +1,89 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from books.models import Book
+from books.utils import BookRecord
+
+
+def make_rows(count):
+    rng = random.Random(42)
+    genres = [code for code, _ in Book.GENRE_CHOICES]
+    return [{
+        'id': i,
+        'title': f'Книга {i}',
+        'author': f'Автор {rng.randrange(count // 10 + 1)}',
+        'isbn': '978-5-699-12345-6',
+        'publication_year': rng.randint(1800, 2025),
+        'genre': rng.choice(genres),
+        'langua': 'Русский',
+        'page_count': rng.randint(50, 1200),
+        'description': '',
+        'created_at': f'2025-01-01T00:00:{i % 60:02d}+00:00',
+    } for i in range(count)]
+
+
+def build_legacy(rows):
+    """Прежний вариант из book_list: новый класс на каждую запись"""
+    books = []
+    for book_data in rows:
+        class BookLikeObject:
+            def __init__(self, data):
+                self.id = data.get('id')
+                self.title = data.get('title', '')
+                self.author = data.get('author', '')
+                self.isbn = data.get('isbn', '')
+                self.publication_year = data.get('publication_year')
+                self.genre = data.get('genre', 'other')
+                self.langua = data.get('langua', 'Русский')
+                self.page_count = data.get('page_count')
+                self.description = data.get('description', '')
+                self.created_at = data.get('created_at')
+
+            def get_genre_display(self):
+                genre_dict = dict(Book.GENRE_CHOICES)
+                return genre_dict.get(self.genre, self.genre)
+
+        books.append(BookLikeObject(book_data))
+    return books
+
+
+def build_records(rows):
+    return tuple(BookRecord.from_dict(row) for row in rows)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает память и время BookRecord с прежними объектами BookLikeObject'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100_000, help='Сколько записей создать')
+
+    def handle(self, *args, **options):
+        rows = make_rows(options['count'])
+        self.stdout.write(f'Записей: {len(rows)}')
+
+        for name, build in (('BookLikeObject', build_legacy), ('BookRecord', build_records)):
+            started = time.perf_counter()
+            books = build(rows)
+            build_time = time.perf_counter() - started
+            del books
+
+            # Память меряем отдельным проходом: tracemalloc сильно замедляет создание
+            tracemalloc.start()
+            books = build(rows)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            started = time.perf_counter()
+            for book in books:
+                book.get_genre_display()
+            display_time = time.perf_counter() - started
+
+            self.stdout.write(
+                f'{name:<16} создание {build_time * 1000:8.1f} мс   '
+                f'get_genre_display {display_time * 1000:7.1f} мс   '
+                f'память {memory / 1024 / 1024:7.1f} МиБ'
+            )
+            del books
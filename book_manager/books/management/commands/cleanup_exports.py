@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from books.export_manager import ExportManager
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые экспорты из DATA_ROOT по лимитам BOOKS_EXPORTS_MAX_* (или заданным явно)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-count', type=int, help='Сколько экспортов оставить')
+        parser.add_argument('--max-age', type=float, help='Максимальный возраст экспорта в секундах')
+        parser.add_argument('--max-bytes', type=int, help='Максимальный общий размер экспортов в байтах')
+
+    def handle(self, *args, **options):
+        removed = ExportManager.cleanup(
+            max_count=options['max_count'],
+            max_age=options['max_age'],
+            max_bytes=options['max_bytes'],
+        )
+        for name in removed:
+            self.stdout.write(f'Удалён {name}')
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {len(removed)}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from books.stats import CatalogStats
+from books.utils import FileHandler
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику каталога (книги по источникам, жанрам и языкам, файлы в DATA_ROOT)'
+
+    def handle(self, *args, **options):
+        # Статистика лежит в кэше каждого процесса со своей версией каталога; touch()
+        # меняет версию, и все процессы (веб-воркеры тоже) пересчитают её при чтении
+        FileHandler.touch()
+        stats = CatalogStats.recompute()
+
+        for source, title in (('db', 'БД'), ('file', 'Файл')):
+            counts = stats[source]
+            self.stdout.write(f"{title}: {counts['total']} книг")
+            self.stdout.write(f"  жанры: {counts['genres']}")
+            self.stdout.write(f"  языки: {counts['languages']}")
+        self.stdout.write(f"Файлов в каталоге данных: {stats['files_count']} ({stats['files_size']} байт)")
@@ -0,0 +1,59 @@
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from books.jobs import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи (импорт, экспорт) из очереди в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.BOOKS_JOB_WORKERS, help='Сколько задач выполнять одновременно')
+        parser.add_argument('--poll', type=float, default=1.0, help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true', help='Выполнить задачи из очереди и выйти')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(f'{prefix}:{number}', stop, options['poll'], options['once']),
+                name=f'job-worker-{number}',
+            )
+            for number in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Запущено воркеров: {len(threads)}")
+
+        # join с таймаутом, чтобы главный поток успевал обработать сигналы
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+
+    def work(self, worker, stop, poll, once):
+        try:
+            while not stop.is_set():
+                job = claim_job(worker)
+                if job is None:
+                    if once:
+                        break
+                    stop.wait(poll)
+                    continue
+                self.stdout.write(f'{worker}: {job}')
+                run_job(job)
+                job.refresh_from_db()
+                self.stdout.write(f'{worker}: {job}')
+        finally:
+            # У каждого потока своё соединение с БД
+            connections.close_all()
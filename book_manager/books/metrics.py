@@ -0,0 +1,189 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+# Границы корзин гистограмм в секундах (как у клиентов Prometheus по умолчанию)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Корзины для количества SQL-запросов за один HTTP-запрос
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля сверху - граница корзины, в которую он попал"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry:
+    """Счётчики и гистограммы процесса; у каждого воркера gunicorn свои"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}        # имя -> (тип, описание)
+        self._counters = {}    # (имя, метки) -> значение
+        self._histograms = {}  # (имя, метки) -> Histogram
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def counters(self, name):
+        """{метки: значение} для одного счётчика"""
+        with self._lock:
+            return {labels: value for (metric, labels), value in self._counters.items() if metric == name}
+
+    def histograms(self, name):
+        with self._lock:
+            return {labels: histogram for (metric, labels), histogram in self._histograms.items() if metric == name}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            lines = []
+            described = set()
+
+            def header(name):
+                if name not in described and name in self._help:
+                    kind, help_text = self._help[name]
+                    lines.append(f'# HELP {name} {help_text}')
+                    lines.append(f'# TYPE {name} {kind}')
+                described.add(name)
+
+            for (name, labels), value in counters:
+                header(name)
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+            for (name, labels), histogram in histograms:
+                header(name)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    bucket_labels = labels + (('le', bound if bound == '+Inf' else _number(bound)),)
+                    lines.append(f'{name}_bucket{_labels(bucket_labels)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(histogram.sum)}')
+                lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+registry = MetricsRegistry()
+registry.describe('books_request_duration_seconds', 'histogram', 'Время обработки запроса до отдачи ответа')
+registry.describe('books_requests_total', 'counter', 'Запросы по представлениям и кодам ответа')
+registry.describe('books_request_db_queries', 'histogram', 'SQL-запросов за один HTTP-запрос')
+registry.describe('books_db_queries_total', 'counter', 'SQL-запросы по представлениям')
+registry.describe('books_db_query_seconds_total', 'counter', 'Время SQL-запросов по представлениям')
+registry.describe('books_file_io_operations_total', 'counter', 'Операции FileHandler с файлами каталога')
+registry.describe('books_file_io_bytes_total', 'counter', 'Прочитано и записано байт в операциях FileHandler')
+registry.describe('books_file_io_seconds_total', 'counter', 'Время операций FileHandler, включая разбор и сериализацию JSON')
+registry.describe('books_db_pool_wait_seconds', 'histogram', 'Ожидание свободного соединения в пуле БД (ENGINE books.db_pool)')
+registry.describe('books_db_pool_timeouts_total', 'counter', 'Соединение из пула БД не дождались за TIMEOUT')
+
+
+def is_enabled():
+    return settings.BOOKS_METRICS
+
+
+def observe_request(view, status, seconds, queries, query_seconds):
+    registry.observe('books_request_duration_seconds', seconds, view=view)
+    registry.inc('books_requests_total', view=view, status=status)
+    registry.observe('books_request_db_queries', queries, buckets=QUERY_COUNT_BUCKETS, view=view)
+    if queries:
+        registry.inc('books_db_queries_total', queries, view=view)
+        registry.inc('books_db_query_seconds_total', query_seconds, view=view)
+
+
+def observe_file_io(op, started, nbytes=0):
+    """Операция FileHandler: op - read/write/append/chunk, started - time.perf_counter() в начале"""
+    if not settings.BOOKS_METRICS:
+        return
+    registry.inc('books_file_io_operations_total', op=op)
+    registry.inc('books_file_io_seconds_total', time.perf_counter() - started, op=op)
+    if nbytes:
+        registry.inc('books_file_io_bytes_total', nbytes, op=op)
+
+
+def dashboard_rows():
+    """Сводка для страницы метрик: по представлениям и по операциям с файлами"""
+    db_queries = registry.counters('books_db_queries_total')
+    db_seconds = registry.counters('books_db_query_seconds_total')
+    views = []
+    for labels, histogram in sorted(registry.histograms('books_request_duration_seconds').items()):
+        count = histogram.count
+        views.append({
+            'view': dict(labels)['view'],
+            'requests': count,
+            'avg_ms': histogram.sum / count * 1000,
+            'p50_ms': histogram.quantile(0.5) * 1000,
+            'p95_ms': histogram.quantile(0.95) * 1000,
+            'queries': db_queries.get(labels, 0) / count,
+            'db_ms': db_seconds.get(labels, 0) / count * 1000,
+        })
+
+    io_bytes = registry.counters('books_file_io_bytes_total')
+    io_seconds = registry.counters('books_file_io_seconds_total')
+    file_io = [
+        {
+            'op': dict(labels)['op'],
+            'operations': count,
+            'bytes': io_bytes.get(labels, 0),
+            'ms': io_seconds.get(labels, 0) * 1000,
+        }
+        for labels, count in sorted(registry.counters('books_file_io_operations_total').items())
+    ]
+    return views, file_io
@@ -0,0 +1,70 @@
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+
+# QueryStats текущего HTTP-запроса; потоки, которые выполняют часть его работы
+# (поиск в БД из search_catalog), получают его через contextvars.copy_context()
+current_query_stats = ContextVar('current_query_stats', default=None)
+
+
+class QueryStats:
+    """execute_wrapper: считает SQL-запросы и их время"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()  # запросы одного HTTP-запроса могут идти из разных потоков
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self._lock:
+                self.count += 1
+                self.seconds += time.perf_counter() - started
+
+
+@contextmanager
+def track_queries():
+    """Учитывает SQL-запросы этого потока в статистике текущего HTTP-запроса"""
+    queries = current_query_stats.get()
+    with ExitStack() as stack:
+        if queries is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+        yield
+
+
+class MetricsMiddleware:
+    """Время ответа и SQL-запросы по представлениям (см. books.metrics).
+
+    Для потоковых ответов (экспорт) учитывается время до начала отдачи.
+    При BOOKS_METRICS = False middleware отключается целиком.
+    """
+
+    def __init__(self, get_response):
+        if not metrics.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryStats()
+        token = current_query_stats.set(queries)
+        started = time.perf_counter()
+        try:
+            with track_queries():
+                response = self.get_response(request)
+        finally:
+            current_query_stats.reset(token)
+        seconds = time.perf_counter() - started
+
+        view = getattr(request.resolver_match, 'url_name', None) or 'unresolved'
+        metrics.observe_request(view, response.status_code, seconds, queries.count, queries.seconds)
+        return response
@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# SQL записан целиком здесь, а не взят из books.search: миграция должна
+# создавать тот же индекс, как бы ни менялся код поиска потом
+
+# Выражение должно совпадать с POSTGRES_VECTOR в books.search - иначе индекс не используется
+POSTGRES_CREATE = (
+    "CREATE INDEX IF NOT EXISTS books_book_search_idx ON books_book USING GIN ("
+    "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, '') || ' ' || "
+    "coalesce(description, '') || ' ' || coalesce(isbn, '') || ' ' || coalesce(genre, '') || ' ' || "
+    "coalesce(langua, '')))"
+)
+POSTGRES_DROP = 'DROP INDEX IF EXISTS books_book_search_idx'
+
+SQLITE_CREATE_TABLE = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS books_book_fts USING fts5('
+    'title, author, description, isbn, genre, langua, '
+    "content='books_book', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_INSERT_NEW = (
+    'INSERT INTO books_book_fts(rowid, title, author, description, isbn, genre, langua) '
+    'VALUES (new.id, new.title, new.author, new.description, new.isbn, new.genre, new.langua);'
+)
+SQLITE_DELETE_OLD = (
+    'INSERT INTO books_book_fts(books_book_fts, rowid, title, author, description, isbn, genre, langua) '
+    "VALUES ('delete', old.id, old.title, old.author, old.description, old.isbn, old.genre, old.langua);"
+)
+SQLITE_TRIGGERS = (
+    f'CREATE TRIGGER IF NOT EXISTS books_book_fts_ai AFTER INSERT ON books_book BEGIN {SQLITE_INSERT_NEW} END',
+    f'CREATE TRIGGER IF NOT EXISTS books_book_fts_ad AFTER DELETE ON books_book BEGIN {SQLITE_DELETE_OLD} END',
+    f'CREATE TRIGGER IF NOT EXISTS books_book_fts_au AFTER UPDATE ON books_book '
+    f'BEGIN {SQLITE_DELETE_OLD} {SQLITE_INSERT_NEW} END',
+)
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return  # без FTS5 остаётся поиск через icontains
+
+        schema_editor.execute(SQLITE_CREATE_TABLE)
+        for sql in SQLITE_TRIGGERS:
+            schema_editor.execute(sql)
+        schema_editor.execute("INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')")
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_DROP)
+    elif vendor == 'sqlite':
+        for trigger in ('books_book_fts_ai', 'books_book_fts_ad', 'books_book_fts_au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS books_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_remove_book_publisher_book_langua'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
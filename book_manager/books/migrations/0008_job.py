@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_book_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('import', 'Импорт'), ('export', 'Экспорт')], max_length=10, verbose_name='Тип')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('params', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('progress', models.BigIntegerField(default=0, verbose_name='Выполнено')),
+                ('total', models.BigIntegerField(blank=True, null=True, verbose_name='Всего')),
+                ('message', models.TextField(blank=True, verbose_name='Сообщение')),
+                ('result_path', models.CharField(blank=True, max_length=500, verbose_name='Файл результата')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Воркер')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Задача',
+                'verbose_name_plural': 'Задачи',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='job_queue_idx')],
+            },
+        ),
+    ]
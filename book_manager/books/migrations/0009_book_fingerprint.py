@@ -0,0 +1,82 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:03
+
+import books.models
+from django.db import migrations
+
+
+def fill_fingerprints(apps, schema_editor):
+    """Заполняет fingerprint; дубликаты, которые уже были в базе, не удаляются.
+
+    Отпечаток получает первая (самая старая) книга, у её повторов остаётся NULL.
+    Такие строки уникальный индекс не защищает: их можно найти через
+    Book.objects.filter(fingerprint__isnull=True) и удалить или исправить вручную.
+    Сохранить такую книгу без изменения названия, автора или года нельзя -
+    FingerprintField посчитает тот же отпечаток и упрётся в индекс
+    """
+    Book = apps.get_model('books', 'Book')
+    seen = set()
+    batch = []
+    for book in Book.objects.order_by('id').only('id', 'title', 'author', 'publication_year').iterator(chunk_size=2000):
+        fingerprint = books.models.book_fingerprint(book.title, book.author, book.publication_year)
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        book.fingerprint = fingerprint
+        batch.append(book)
+        if len(batch) >= 2000:
+            Book.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    if batch:
+        Book.objects.bulk_update(batch, ['fingerprint'])
+
+
+# Триггеры FTS5 из 0006_book_search_index: SQLite теряет их, когда пересоздаёт books_book
+_INSERT_NEW = (
+    'INSERT INTO books_book_fts(rowid, title, author, description, isbn, genre, langua) '
+    'VALUES (new.id, new.title, new.author, new.description, new.isbn, new.genre, new.langua);'
+)
+_DELETE_OLD = (
+    'INSERT INTO books_book_fts(books_book_fts, rowid, title, author, description, isbn, genre, langua) '
+    "VALUES ('delete', old.id, old.title, old.author, old.description, old.isbn, old.genre, old.langua);"
+)
+FTS_TRIGGERS = (
+    f'CREATE TRIGGER IF NOT EXISTS books_book_fts_ai AFTER INSERT ON books_book BEGIN {_INSERT_NEW} END',
+    f'CREATE TRIGGER IF NOT EXISTS books_book_fts_ad AFTER DELETE ON books_book BEGIN {_DELETE_OLD} END',
+    f'CREATE TRIGGER IF NOT EXISTS books_book_fts_au AFTER UPDATE ON books_book BEGIN {_DELETE_OLD} {_INSERT_NEW} END',
+)
+
+
+def restore_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and 'books_book_fts' in connection.introspection.table_names():
+        for sql in FTS_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_job'),
+    ]
+
+    operations = [
+        # При откате таблица тоже пересоздаётся - триггеры возвращаем последним шагом
+        migrations.RunPython(migrations.RunPython.noop, restore_triggers),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_duplicate_idx',
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='fingerprint',
+            field=books.models.FingerprintField(editable=False, max_length=40, null=True),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='book',
+            name='fingerprint',
+            field=books.models.FingerprintField(editable=False, max_length=40, null=True, unique=True),
+        ),
+        # SQLite пересоздаёт таблицу при добавлении UNIQUE и теряет триггеры FTS5
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
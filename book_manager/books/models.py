@@ -2,7 +2,9 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from django.urls import reverse
 from django.core.exceptions import ValidationError
+import hashlib
 import re
+import unicodedata
 
 def validate_isbn(value):
     """Валидация ISBN"""
@@ -20,6 +22,38 @@ def validate_publication_year(value):
         raise ValidationError('Год публикации должен быть между 1000 и 2030')
     return value
 
+def _normalize(value):
+    # Регистр, «ё», лишние пробелы и варианты записи символов (NFKC) не различаем
+    value = unicodedata.normalize('NFKC', str(value or '')).casefold().replace('ё', 'е')
+    return ' '.join(value.split())
+
+def book_fingerprint(title, author, publication_year):
+    """Ключ дубликата: хэш нормализованных названия, автора и года"""
+    key = '\x1f'.join((_normalize(title), _normalize(author), str(publication_year or '')))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+# Поля, которые показывает строка списка книг (templates/books/_book_row.html)
+ROW_FIELDS = ('id', 'title', 'author', 'publication_year', 'genre', 'langua')
+
+def book_cache_version(book):
+    """Версия строки книги для кэша фрагментов: меняется вместе с показанными полями"""
+    key = repr(tuple(getattr(book, field) for field in ROW_FIELDS))
+    return hashlib.md5(key.encode('utf-8')).hexdigest()[:12]
+
+class FingerprintField(models.CharField):
+    """Поле с book_fingerprint, которое заполняется само при save() и bulk_create()"""
+
+    def pre_save(self, model_instance, add):
+        value = book_fingerprint(model_instance.title, model_instance.author, model_instance.publication_year)
+        setattr(model_instance, self.attname, value)
+        return value
+
+class BookQuerySet(models.QuerySet):
+    def search(self, query, limit=10):
+        """Поиск книг с ранжированием; способ поиска зависит от СУБД"""
+        from .search import get_search_backend
+        return get_search_backend(self.db).search(self, query, limit)
+
 class Book(models.Model):
     GENRE_CHOICES = [
         ('fiction', 'Художественная литература'),
@@ -42,13 +76,114 @@ class Book(models.Model):
     langua = models.CharField(max_length=17, verbose_name="Язык", blank=True, null=True)
     description = models.TextField(verbose_name="Описание", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Уникальный индекс вместо поиска дубликатов по трём полям; NULL - у старых
+    # дубликатов, которые были в базе до появления поля (их индекс не защищает,
+    # см. миграцию 0009_book_fingerprint)
+    fingerprint = FingerprintField(max_length=40, unique=True, null=True, editable=False)
+
+    objects = BookQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.title} - {self.author}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        # Жанр и язык, с которыми книга лежит в БД: по ним статистика при сохранении
+        # переносит книгу между счётчиками без лишнего SELECT (см. signals.book_saving)
+        if 'genre' in field_names and 'langua' in field_names:
+            book._stats_loaded = (book.genre, book.langua)
+        return book
+
     def get_absolute_url(self):
         return reverse('book_list')
 
+    @property
+    def cache_version(self):
+        return book_cache_version(self)
+
     class Meta:
         verbose_name = "Книга"
-        verbose_name_plural = "Книги"
\ No newline at end of file
+        verbose_name_plural = "Книги"
+        indexes = [
+            # Список книг: ORDER BY created_at DESC (id - для однозначного порядка)
+            models.Index(fields=['-created_at', '-id'], name='book_created_at_idx'),
+            # Фильтры админки; второе поле - её сортировка по -created_at
+            models.Index(fields=['genre', '-created_at'], name='book_genre_idx'),
+            models.Index(fields=['publication_year', '-created_at'], name='book_year_idx'),
+        ]
+
+# Код жанра -> название; чтобы не собирать dict(GENRE_CHOICES) на каждый вызов
+GENRE_LABELS = dict(Book.GENRE_CHOICES)
+
+
+class Job(models.Model):
+    """Фоновая задача (импорт или экспорт); выполняет её manage.py run_jobs"""
+
+    KIND_IMPORT = 'import'
+    KIND_EXPORT = 'export'
+    KIND_CHOICES = [
+        (KIND_IMPORT, 'Импорт'),
+        (KIND_EXPORT, 'Экспорт'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Тип")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Статус")
+    params = models.JSONField(default=dict, verbose_name="Параметры")
+    progress = models.BigIntegerField(default=0, verbose_name="Выполнено")
+    total = models.BigIntegerField(null=True, blank=True, verbose_name="Всего")
+    message = models.TextField(blank=True, verbose_name="Сообщение")
+    result_path = models.CharField(max_length=500, blank=True, verbose_name="Файл результата")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Воркер")
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Обновляется вместе с прогрессом; по нему находятся задачи упавших воркеров
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def percent(self):
+        if self.status == self.STATUS_DONE:
+            return 100
+        if not self.total:
+            return 0
+        return min(int(self.progress * 100 / self.total), 99)
+
+    @property
+    def is_downloadable(self):
+        return self.status == self.STATUS_DONE and bool(self.result_path)
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'kind': self.kind,
+            'status': self.status,
+            'status_display': self.get_status_display(),
+            'progress': self.progress,
+            'total': self.total,
+            'percent': self.percent,
+            'message': self.message,
+            'download_url': reverse('job_download', args=[self.pk]) if self.is_downloadable else None,
+        }
+
+    class Meta:
+        verbose_name = "Задача"
+        verbose_name_plural = "Задачи"
+        indexes = [
+            # Выбор следующей задачи: WHERE status = ... ORDER BY created_at
+            models.Index(fields=['status', 'created_at'], name='job_queue_idx'),
+        ]
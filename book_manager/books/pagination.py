@@ -0,0 +1,116 @@
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Книг на странице списка
+BOOKS_PER_PAGE = 10
+
+
+def encode_cursor(created_at, pk):
+    """Непрозрачный токен позиции в списке: (created_at, id) в base64"""
+    raw = json.dumps([created_at, pk], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """(created_at, id) из токена или None, если токен испорчен - тогда показывается первая страница"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, pk = json.loads(raw)
+        # Токен приходит из URL: проверяем типы, иначе сломаются запрос к БД и bisect
+        if not isinstance(created_at, str) or parse_datetime(created_at) is None:
+            return None
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if not isinstance(pk, int) or isinstance(pk, bool):
+        return None
+    return created_at, pk
+
+
+class KeysetPage:
+    """Страница курсорной пагинации; для шаблона ведёт себя как Page из Paginator"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _position(book):
+    # Книга из queryset или словарь из values()
+    if isinstance(book, dict):
+        return book['created_at'].isoformat(), book['id']
+    return book.created_at.isoformat(), book.id
+
+
+def paginate_queryset(queryset, after=None, before=None, per_page=BOOKS_PER_PAGE):
+    """Страница книг из БД в порядке (-created_at, -id) без OFFSET и COUNT(*).
+
+    queryset может быть и values() - тогда в нём должны быть поля created_at и id
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+
+    if before:
+        created_at, pk = parse_datetime(before[0]), before[1]
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+        rows = list(queryset.order_by('created_at', 'id')[:per_page + 1])
+        has_more, books = len(rows) > per_page, rows[:per_page][::-1]
+        has_next, has_previous = True, has_more
+    else:
+        if after:
+            created_at, pk = parse_datetime(after[0]), after[1]
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        has_more, books = len(rows) > per_page, rows[:per_page]
+        has_next, has_previous = has_more, after is not None
+
+    if not books:
+        return KeysetPage([])
+    first, last = books[0], books[-1]
+    return KeysetPage(
+        books,
+        next_cursor=encode_cursor(*_position(last)) if has_next else None,
+        previous_cursor=encode_cursor(*_position(first)) if has_previous else None,
+    )
+
+
+def paginate_sorted(records, keys, after=None, before=None, per_page=BOOKS_PER_PAGE):
+    """То же для книг из файла: records и keys отсортированы по возрастанию ключа"""
+    after, before = decode_cursor(after), decode_cursor(before)
+
+    # Страница - это срез [start, end) возрастающего списка, показанный в обратном порядке
+    if before:
+        start = bisect_right(keys, tuple(before))
+        end = min(start + per_page, len(records))
+    else:
+        end = bisect_left(keys, tuple(after)) if after else len(records)
+        start = max(end - per_page, 0)
+
+    if start >= end:
+        return KeysetPage([])
+    return KeysetPage(
+        records[start:end][::-1],
+        next_cursor=encode_cursor(*keys[start]) if start > 0 else None,
+        previous_cursor=encode_cursor(*keys[end - 1]) if end < len(records) else None,
+    )
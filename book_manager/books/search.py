@@ -0,0 +1,233 @@
+import contextvars
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import Q
+
+# Поля книги, по которым идёт поиск
+SEARCH_FIELDS = ('title', 'author', 'description', 'isbn', 'genre', 'langua')
+
+# Таблицу FTS5 и её триггеры создаёт миграция 0006_book_search_index
+SQLITE_FTS_TABLE = 'books_book_fts'
+
+# Выражение tsvector; должно совпадать с индексом books_book_search_idx
+# из миграции 0006, иначе PostgreSQL не сможет использовать индекс
+POSTGRES_VECTOR = "to_tsvector('simple', {})".format(
+    " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+)
+
+
+def query_terms(query):
+    """Разбивает запрос на слова (буквы и цифры) в нижнем регистре"""
+    return re.findall(r'\w+', query.lower())
+
+
+class BookSearchBackend:
+    """Поиск подстрокой (icontains) по всем полям - работает на любой СУБД"""
+
+    def search(self, queryset, query, limit):
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__icontains': query})
+        return list(queryset.filter(condition)[:limit])
+
+    def matches(self, query, text):
+        """Подходит ли книга (её поля, склеенные в text) под запрос - без обращения к БД"""
+        return query.lower() in text
+
+
+class RankedSearchBackend(BookSearchBackend):
+    """Общая часть полнотекстовых бэкендов: id по релевантности, затем сами книги"""
+
+    def search(self, queryset, query, limit):
+        terms = query_terms(query)
+        if not terms:
+            return super().search(queryset, query, limit)
+
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(self.sql, self.params(terms, limit))
+            ids = [row[0] for row in cursor.fetchall()]
+
+        books = queryset.in_bulk(ids)
+        return [books[book_id] for book_id in ids if book_id in books]
+
+    def matches(self, query, text):
+        terms = query_terms(query)
+        if not terms:
+            return super().matches(query, text)
+        words = query_terms(text)
+        return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+class SQLiteFTSBackend(RankedSearchBackend):
+    """FTS5-таблица books_book_fts, которую синхронизируют триггеры"""
+
+    sql = (
+        f'SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s '
+        'ORDER BY rank LIMIT %s'
+    )
+
+    def params(self, terms, limit):
+        # "слово"* - поиск по префиксу, чтобы подсказки появлялись во время набора
+        return [' '.join(f'"{term}"*' for term in terms), limit]
+
+
+class PostgresSearchBackend(RankedSearchBackend):
+    """tsvector с GIN-индексом books_book_search_idx"""
+
+    sql = (
+        f"SELECT id FROM books_book WHERE {POSTGRES_VECTOR} @@ to_tsquery('simple', %s) "
+        f"ORDER BY ts_rank({POSTGRES_VECTOR}, to_tsquery('simple', %s)) DESC LIMIT %s"
+    )
+
+    def params(self, terms, limit):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return [tsquery, tsquery, limit]
+
+
+_backends = {}
+
+
+def get_search_backend(using='default'):
+    if using not in _backends:
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            backend = PostgresSearchBackend()
+        elif connection.vendor == 'sqlite' and SQLITE_FTS_TABLE in connection.introspection.table_names():
+            backend = SQLiteFTSBackend()
+        else:
+            # SQLite без FTS5 или другая СУБД
+            backend = BookSearchBackend()
+        _backends[using] = backend
+    return _backends[using]
+
+
+def book_search_text(book):
+    """Поля книги одной строкой в нижнем регистре - для BookSearchBackend.matches"""
+    return '\n'.join(str(getattr(book, field) or '') for field in SEARCH_FIELDS).lower()
+
+
+def _db_result(book):
+    return {
+        'id': book.id,
+        'title': book.title,
+        'author': book.author,
+        'publication_year': book.publication_year,
+        'genre': book.get_genre_display(),
+        'langua': book.langua or '',
+        'edit_url': f"/books/{book.id}/edit/", # даёт путь вида, по которому отправляется запрос, чтобы открыть форму редактирования книги
+        'delete_url': f"/books/{book.id}/delete/",
+        'source': 'db',
+        '_text': book_search_text(book),
+    }
+
+
+def _file_result(index, position):
+    book = index.records[position]
+    return {
+        'id': book.id or 0,
+        'title': book.title,
+        'author': book.author,
+        'publication_year': book.publication_year or '',
+        'genre': book.get_genre_display(),
+        'langua': book.langua or '',
+        'edit_url': f"/books/{book.id}/edit/" if book.id else '#',
+        'delete_url': f"/books/{book.id}/delete/" if book.id else '#',
+        'source': 'file',
+        '_text': index.texts[position],
+    }
+
+
+def _search_db(query, limit):
+    from .middleware import track_queries
+    from .models import Book
+    try:
+        # Полнотекстовый индекс (FTS5 / tsvector), если он есть; запросы идут в метрики HTTP-запроса
+        with track_queries():
+            return [_db_result(book) for book in Book.objects.search(query, limit=limit)]
+    finally:
+        # Поток пула не проходит через request_finished - закрываем соединение сами
+        close_old_connections()
+
+
+def _search_file(query, limit):
+    from .utils import FileHandler
+    # N-граммный индекс строится один раз на версию файла; сначала новые книги
+    _, _, index = FileHandler.load_search_index()
+    return [_file_result(index, position) for position in index.search(query, limit=limit, newest_first=True)]
+
+
+def _book_identity(item):
+    # Книга, сохранённая и в БД, и в файле, совпадает по названию, автору и году
+    return item['title'].lower(), item['author'].lower(), str(item['publication_year'])
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.BOOKS_SEARCH_WORKERS, thread_name_prefix='book-search')
+        return _executor
+
+
+def search_catalog(query, db_limit=10, total_limit=15):
+    """Подсказки для поиска: БД и файл ищутся параллельно, книги из БД идут первыми.
+
+    Возвращает (результаты, полный ли список, ответили ли оба источника).
+    Список полный, если ни один источник не упёрся в лимит - тогда его можно
+    фильтровать для более длинного запроса. Если БД не дождались или поиск
+    в файле упал, результаты частичные и кэшировать их нельзя.
+    В каждом результате есть служебное поле '_text'.
+    """
+    # Из файла берём с запасом: часть книг окажется дублями книг из БД
+    file_limit = total_limit + db_limit
+    executor = _get_executor()
+    # Контекст запроса (статистика SQL для метрик) передаём в поток пула
+    db_future = executor.submit(contextvars.copy_context().run, _search_db, query, db_limit)
+    file_future = executor.submit(_search_file, query, file_limit)
+
+    done, _ = wait([db_future, file_future], return_when=FIRST_COMPLETED)
+    if file_future in done and file_future.exception() is None and len(file_future.result()) >= total_limit:
+        # Файл уже заполнил весь список - медленную БД ждём недолго, потом бросаем
+        wait([db_future], timeout=settings.BOOKS_SEARCH_GRACE)
+    else:
+        wait([db_future, file_future])
+
+    answered = True
+    if db_future.done():
+        db_results = db_future.result()  # ошибку БД отдаём наверх, как и раньше
+        complete = len(db_results) < db_limit
+    else:
+        db_future.cancel()
+        db_results, complete, answered = [], False, False
+
+    try:
+        file_results = file_future.result()
+        complete = complete and len(file_results) < file_limit
+    except Exception as e:
+        print(f"Ошибка при поиске в файле: {e}")
+        # Продолжаем работу, но такой список нельзя считать полным
+        file_results, complete, answered = [], False, False
+
+    # Для всех найденных книг: сначала БД, затем файл без повторов
+    results = list(db_results)
+    seen = {_book_identity(item) for item in results}
+    for item in file_results:
+        identity = _book_identity(item)
+        if identity in seen:
+            continue
+        if len(results) >= total_limit:  # Общее ограничение
+            complete = False
+            break
+        seen.add(identity)
+        results.append(item)
+
+    return results, complete, answered
+
@@ -0,0 +1,81 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+
+from .search import get_search_backend, search_catalog
+from .utils import books_file_cache
+
+DB_GENERATION_KEY = 'books:db_generation'
+
+
+def _cache():
+    return caches['search']
+
+
+def db_generation():
+    """Версия каталога в БД: растёт при каждом изменении книг"""
+    generation = _cache().get(DB_GENERATION_KEY)
+    if generation is None:
+        # Начинаем со времени, чтобы после очистки кэша не совпасть со старой версией
+        _cache().add(DB_GENERATION_KEY, time.time_ns(), None)
+        generation = _cache().get(DB_GENERATION_KEY)
+    return generation
+
+
+def bump_db_generation():
+    try:
+        _cache().incr(DB_GENERATION_KEY)
+    except ValueError:
+        _cache().add(DB_GENERATION_KEY, time.time_ns(), None)
+
+
+def file_generation():
+    """Версия books.json: меняется вместе с подписью файла и журнала"""
+    return hashlib.md5(repr(books_file_cache.signature()).encode()).hexdigest()[:12]
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+def _key(generation, query):
+    return f'search:{generation}:{hashlib.md5(query.encode("utf-8")).hexdigest()}'
+
+
+def _matches(item, query):
+    if item['source'] == 'db':
+        return get_search_backend().matches(query, item['_text'])
+    return query in item['_text']
+
+
+def cached_search(query):
+    """search_catalog с кэшем; в ключе - запрос и версии каталога в БД и в файле"""
+    query = normalize_query(query)
+    if len(query) < 2:
+        return []
+    generation = f'{db_generation()}:{file_generation()}'
+    cache = _cache()
+
+    # Сам запрос и все его префиксы (от длинных к коротким) - одним обращением к кэшу
+    keys = [_key(generation, query[:length]) for length in range(len(query), 1, -1)]
+    found = cache.get_many(keys)
+
+    entry = found.get(keys[0])
+    if entry is None:
+        answered = True
+        for key in keys[1:]:
+            shorter = found.get(key)
+            if shorter is not None and shorter['complete']:
+                # Совпадения более длинного запроса - подмножество полного списка по префиксу
+                results = [item for item in shorter['results'] if _matches(item, query)]
+                entry = {'results': results, 'complete': True}
+                break
+        else:
+            results, complete, answered = search_catalog(query)
+            entry = {'results': results, 'complete': complete}
+        if answered:
+            # Без ответа БД (или файла) список частичный - в кэше он остался бы на весь TIMEOUT
+            cache.set(keys[0], entry)
+
+    return [{k: v for k, v in item.items() if k != '_text'} for item in entry['results']]
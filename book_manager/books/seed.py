@@ -0,0 +1,161 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+
+from .importers import find_duplicates, load_missing_ids
+from .models import Book, book_fingerprint
+from .search_cache import bump_db_generation
+from .stats import book_stats_values
+from .utils import FileHandler
+
+RU_ADJECTIVES = ['Тихий', 'Последний', 'Белый', 'Тёмный', 'Золотой', 'Старый', 'Северный', 'Долгий', 'Первый', 'Забытый', 'Дальний', 'Красный']
+RU_NOUNS = ['дом', 'берег', 'сад', 'путь', 'город', 'лес', 'остров', 'век', 'огонь', 'ветер', 'мост', 'вокзал']
+RU_TAILS = ['', '', ' у моря', ' над рекой', ' в степи', ': рассказы', ' на окраине', ' и его тени', ' зимой']
+RU_FIRST_NAMES = [('Александр', 'm'), ('Михаил', 'm'), ('Сергей', 'm'), ('Николай', 'm'), ('Иван', 'm'), ('Дмитрий', 'm'),
+                  ('Анна', 'f'), ('Мария', 'f'), ('Елена', 'f'), ('Ольга', 'f'), ('Татьяна', 'f'), ('Наталья', 'f')]
+# Все фамилии на -ов/-ев/-ин: женская форма получается добавлением «а»
+RU_LAST_NAMES = ['Соколов', 'Лебедев', 'Морозов', 'Волков', 'Новиков', 'Орлов', 'Зайцев', 'Громов', 'Белкин', 'Ильин', 'Поляков', 'Беляев']
+RU_SENTENCES = [
+    'История одной семьи на протяжении трёх поколений.',
+    'Герой возвращается в родной город и не узнаёт его.',
+    'Роман о дружбе, предательстве и позднем прощении.',
+    'Небольшая экспедиция уходит на север и пропадает.',
+    'Книга основана на письмах и дневниках очевидцев.',
+    'Детективная линия переплетается с историей любви.',
+    'Автор размышляет о памяти и о том, что мы оставляем после себя.',
+    'Действие происходит в провинциальном городке в начале века.',
+]
+
+EN_ADJECTIVES = ['Silent', 'Last', 'White', 'Dark', 'Golden', 'Old', 'Northern', 'Long', 'First', 'Forgotten', 'Distant', 'Red']
+EN_NOUNS = ['House', 'Shore', 'Garden', 'Road', 'City', 'Forest', 'Island', 'Century', 'Fire', 'Wind', 'Bridge', 'Station']
+EN_TAILS = ['', '', ' by the Sea', ' over the River', ' in Winter', ': Stories', ' at the Edge', ' and Its Shadows']
+EN_FIRST_NAMES = ['James', 'Emily', 'Thomas', 'Sarah', 'William', 'Charlotte', 'George', 'Alice', 'Henry', 'Margaret']
+EN_LAST_NAMES = ['Smith', 'Turner', 'Walker', 'Bennett', 'Hughes', 'Clarke', 'Morgan', 'Fletcher', 'Hayes', 'Parker']
+EN_SENTENCES = [
+    'The story of one family across three generations.',
+    'A man returns to his home town and does not recognise it.',
+    'A novel about friendship, betrayal and late forgiveness.',
+    'A small expedition heads north and disappears.',
+    'Based on letters and diaries of eyewitnesses.',
+    'A detective plot intertwined with a love story.',
+    'The author reflects on memory and what we leave behind.',
+    'Set in a provincial town at the turn of the century.',
+]
+
+GENRE_CODES = [code for code, _ in Book.GENRE_CHOICES]
+
+# Доля русских книг в сгенерированном каталоге
+RUSSIAN_SHARE = 0.7
+
+
+def _isbn13(rng):
+    digits = [9, 7, 8] + [rng.randrange(10) for _ in range(9)]
+    check = (10 - sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return ''.join(map(str, digits + [check]))
+
+
+def _russian(rng):
+    first, gender = rng.choice(RU_FIRST_NAMES)
+    last = rng.choice(RU_LAST_NAMES) + ('а' if gender == 'f' else '')
+    title = f'{rng.choice(RU_ADJECTIVES)} {rng.choice(RU_NOUNS)}{rng.choice(RU_TAILS)}'
+    return title, f'{first} {last}', ' '.join(rng.sample(RU_SENTENCES, 2)), 'Русский'
+
+
+def _english(rng):
+    title = f'The {rng.choice(EN_ADJECTIVES)} {rng.choice(EN_NOUNS)}{rng.choice(EN_TAILS)}'
+    author = f'{rng.choice(EN_FIRST_NAMES)} {rng.choice(EN_LAST_NAMES)}'
+    return title, author, ' '.join(rng.sample(EN_SENTENCES, 2)), 'English'
+
+
+def generate_books(count, seed=42, start_id=None, start=None):
+    """Словари книг в формате books.json со случайными, но правдоподобными данными.
+
+    Каталог воспроизводим при одинаковом seed. created_at идут по возрастанию
+    от start (по умолчанию - пять лет назад); id - от start_id или None.
+    """
+    rng = random.Random(seed)
+    start = start or datetime.now(timezone.utc) - timedelta(days=5 * 365)
+    step = timedelta(days=5 * 365) / max(count, 1)
+    seen = set()  # (название, автор, год) - дубликатов в одном каталоге нет
+
+    for i in range(count):
+        while True:
+            title, author, description, langua = (_russian if rng.random() < RUSSIAN_SHARE else _english)(rng)
+            publication_year = rng.randint(1800, 2025)
+            if (title, author, publication_year) not in seen:
+                seen.add((title, author, publication_year))
+                break
+        yield {
+            'id': None if start_id is None else start_id + i,
+            'title': title,
+            'author': author,
+            'isbn': _isbn13(rng) if rng.random() < 0.8 else '',
+            'publication_year': publication_year,
+            'genre': rng.choice(GENRE_CODES),
+            'langua': langua,
+            'page_count': rng.randint(80, 1200),
+            'description': description,
+            'created_at': (start + step * i).isoformat(),
+        }
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_db(count, seed=42, batch_size=5000, journal=True):
+    """Добавляет до count книг в БД пакетами bulk_create; книги, которые уже есть, пропускаются.
+
+    С journal=True книги попадают и в books.json (как при импорте): каждый пакет
+    дописывается в журнал, а books.json переписывается один раз в конце. Иначе
+    меняется только БД, а версия каталога данных сдвигается (FileHandler.touch),
+    чтобы статистика, ETag и экспорты обновились во всех процессах.
+    """
+    for batch in _batches(generate_books(count, seed), batch_size):
+        objs = [Book(**{field: value for field, value in data.items() if field not in ('id', 'created_at')}) for data in batch]
+        dates = [datetime.fromisoformat(data['created_at']) for data in batch]
+        duplicates = find_duplicates(objs)
+        objs = [obj for i, obj in enumerate(objs) if i not in duplicates]
+        dates = [date for i, date in enumerate(dates) if i not in duplicates]
+        with transaction.atomic():
+            books = Book.objects.bulk_create(objs)
+            load_missing_ids(books)
+            # auto_now_add проставил текущее время - возвращаем сгенерированные даты
+            for book, date in zip(books, dates):
+                book.created_at = date
+            Book.objects.bulk_update(books, ['created_at'])
+        if journal:
+            entries = [{'op': 'insert', 'book': FileHandler.book_to_dict(book)} for book in books]
+            changes = [(('db', 'file'), None, book_stats_values(book)) for book in books]
+            # Не CatalogSnapshot.record: при BOOKS_SNAPSHOT_DELAY = 0 он переписывал бы
+            # books.json после каждого пакета, и заполнение росло бы квадратично
+            FileHandler.append_to_journal(entries, changes)
+
+    if journal:
+        FileHandler.compact_journal()
+    else:
+        FileHandler.touch()
+    bump_db_generation()
+
+
+def seed_file(count, seed=42, batch_size=5000):
+    """Добавляет до count книг только в books.json (id выдаёт журнал, см. FILE_BOOK_ID_START)"""
+    fingerprints = FileHandler.load_fingerprints()
+
+    for batch in _batches(generate_books(count, seed), batch_size):
+        batch = [
+            book for book in batch
+            if book_fingerprint(book['title'], book['author'], book['publication_year']) not in fingerprints
+        ]
+        entries = [{'op': 'insert', 'book': book} for book in batch]
+        changes = [(('file',), None, book_stats_values(book)) for book in batch]
+        FileHandler.append_to_journal(entries, changes)
+    FileHandler.compact_journal()
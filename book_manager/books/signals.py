@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Book
+from .snapshot import CatalogSnapshot
+from .stats import CatalogStats, book_stats_values
+from .utils import FileHandler, data_file_written
+
+# Книга из БД есть и в books.json, поэтому её изменение меняет оба источника
+BOTH_SOURCES = ('db', 'file')
+
+# Пока выставлен, сохранение и удаление книг не журналятся по одной: весь пакет
+# пишет в журнал одной записью тот, кто его применяет (см. batch.apply_batch)
+_journal_suppressed = ContextVar('books_journal_suppressed', default=False)
+
+
+@contextmanager
+def journal_suppressed():
+    token = _journal_suppressed.set(True)
+    try:
+        yield
+    finally:
+        _journal_suppressed.reset(token)
+
+
+# Поля книги, которые учитывает статистика (book_stats_values)
+STATS_FIELDS = {'genre', 'langua'}
+
+
+@receiver(pre_save, sender=Book)
+def book_saving(sender, instance, update_fields=None, **kwargs):
+    # Прежние жанр и язык нужны статистике, чтобы перенести книгу между счётчиками
+    instance._stats_old = None
+    if instance.pk is None or instance._state.adding:
+        return
+    if update_fields is not None and not STATS_FIELDS & set(update_fields):
+        instance._stats_old = book_stats_values(instance)
+        return
+    instance._stats_old = getattr(instance, '_stats_loaded', None)
+    if instance._stats_old is None:
+        # Книга не из БД (собрана с pk вручную или без этих полей) - прежние значения спрашиваем
+        instance._stats_old = Book.objects.filter(pk=instance.pk).values_list('genre', 'langua').first()
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, **kwargs):
+    # Теперь в БД эти значения - следующее сохранение того же объекта сравнивается с ними
+    instance._stats_loaded = book_stats_values(instance)
+    if _journal_suppressed.get():
+        return
+    entry = {'op': 'insert' if created else 'update', 'book': FileHandler.book_to_dict(instance)}
+    change = (BOTH_SOURCES, getattr(instance, '_stats_old', None), book_stats_values(instance))
+    # В журнал пишем только после фиксации транзакции
+    transaction.on_commit(lambda: CatalogSnapshot.record([entry], [change]))
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    if _journal_suppressed.get():
+        return
+    entry = {'op': 'delete', 'id': instance.pk}
+    change = (BOTH_SOURCES, book_stats_values(instance), None)
+    transaction.on_commit(lambda: CatalogSnapshot.record([entry], [change]))
+
+
+@receiver(data_file_written)
+def data_file_changed(sender, path, before, changes=None, rebuilt=False, **kwargs):
+    CatalogStats.file_written(path, before, changes, rebuilt)
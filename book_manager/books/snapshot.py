@@ -0,0 +1,82 @@
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+from .utils import FileHandler
+
+class CatalogSnapshot:
+    """Снимок каталога в books.json плюс журнал изменений к нему.
+
+    Каждое изменение дописывается в журнал (record), а mark_dirty() откладывает
+    сжатие журнала на BOOKS_SNAPSHOT_DELAY секунд, чтобы серия изменений
+    (импорт, массовое редактирование) обошлась одной перезаписью books.json.
+    """
+
+    _lock = threading.Lock()
+    _build_lock = threading.Lock()
+    _timer = None
+    _version = 0        # растёт при каждом изменении каталога
+    _built_version = 0  # версия, на которой последний раз обслуживался books.json
+
+    @classmethod
+    def record(cls, entries, changes=None, unique=False):
+        """changes - изменения для статистики каталога (см. CatalogStats.file_written),
+        unique - не записывать книгу, которая уже есть в файле (DuplicateBookError)"""
+        FileHandler.append_to_journal(entries, changes, unique=unique)
+        cls.mark_dirty()
+
+    @classmethod
+    def mark_dirty(cls):
+        from .search_cache import bump_db_generation
+        bump_db_generation()
+
+        delay = settings.BOOKS_SNAPSHOT_DELAY
+        with cls._lock:
+            cls._version += 1
+            if delay > 0 and cls._timer is None:
+                # Все изменения до срабатывания таймера попадут в одну проверку
+                cls._timer = threading.Timer(delay, cls._run_scheduled)
+                cls._timer.daemon = True
+                cls._timer.start()
+
+        if delay <= 0:
+            cls.flush()
+
+    @classmethod
+    def is_dirty(cls):
+        return cls._version != cls._built_version
+
+    @classmethod
+    def flush(cls):
+        """Сжимает журнал, если каталог менялся с последней проверки"""
+        with cls._build_lock:
+            version = cls._version
+            file_path = FileHandler.get_json_file_path()
+            if not os.path.exists(file_path) and not os.path.exists(FileHandler.get_journal_file_path()):
+                # Файлового хранилища ещё нет - собираем снимок из БД
+                FileHandler.save_books_to_json()
+            elif version != cls._built_version:
+                # Переписываем books.json только когда журнал заметно вырос
+                FileHandler.compact_journal(settings.BOOKS_JOURNAL_MAX_BYTES)
+            cls._built_version = version
+            return file_path
+
+    @classmethod
+    def _run_scheduled(cls):
+        with cls._lock:
+            cls._timer = None
+        try:
+            cls.flush()
+        finally:
+            # Поток таймера открывает собственное соединение с БД
+            connections.close_all()
+
+        # Пока файл собирался, могли прийти новые изменения
+        if cls.is_dirty():
+            with cls._lock:
+                if cls._timer is None:
+                    cls._timer = threading.Timer(settings.BOOKS_SNAPSHOT_DELAY, cls._run_scheduled)
+                    cls._timer.daemon = True
+                    cls._timer.start()
@@ -0,0 +1,124 @@
+import os
+import threading
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .utils import DATA_FILE_EXTENSIONS, FileHandler
+
+# Ключ кэша со статистикой каталога
+STATS_CACHE_KEY = 'books:stats'
+
+
+def _empty_counts():
+    return {'total': 0, 'genres': {}, 'languages': {}}
+
+
+def _shift(counter, key, delta):
+    value = counter.get(key, 0) + delta
+    if value > 0:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+
+def _apply(counts, values, delta):
+    genre, langua = values
+    counts['total'] += delta
+    _shift(counts['genres'], genre, delta)
+    _shift(counts['languages'], langua or '', delta)
+
+
+def book_stats_values(book):
+    """То, что учитывает статистика: (жанр, язык) книги - модели или словаря из файла"""
+    if isinstance(book, dict):
+        return book.get('genre', 'other'), book.get('langua', 'Русский')
+    return book.genre, book.langua
+
+
+class CatalogStats:
+    """Счётчики каталога: книги по источникам, жанрам и языкам, файлы в DATA_ROOT.
+
+    Статистика хранится в кэше вместе с FileHandler.data_signature(), на которой
+    она посчитана. Изменения книг и файлов применяются к ней по сигналу
+    data_file_written, пока версия совпадает; если каталог изменил другой процесс,
+    версия расходится и статистика пересчитывается заново.
+    """
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get():
+        stats = cache.get(STATS_CACHE_KEY)
+        if stats is None or stats['version'] != FileHandler.data_signature():
+            stats = CatalogStats.recompute()
+        return stats
+
+    @staticmethod
+    def recompute():
+        """Полный пересчёт: запросы с GROUP BY к БД, проход по книгам из файла и по каталогу данных"""
+        from .models import Book
+
+        before = FileHandler.data_signature()
+        stats = {'version': before, 'db': _empty_counts(), 'file': _empty_counts(), 'files': {}}
+
+        db = stats['db']
+        for row in Book.objects.values('genre').annotate(count=Count('id')).order_by():
+            db['genres'][row['genre']] = row['count']
+            db['total'] += row['count']
+        for row in Book.objects.values('langua').annotate(count=Count('id')).order_by():
+            db['languages'][row['langua'] or ''] = row['count']
+
+        for record in FileHandler.load_book_records():
+            _apply(stats['file'], book_stats_values(record), 1)
+
+        with os.scandir(FileHandler.get_data_path()) as entries:
+            for entry in entries:
+                if entry.name.endswith(DATA_FILE_EXTENSIONS) and entry.is_file():
+                    stats['files'][entry.name] = entry.stat().st_size
+        _summarize(stats)
+
+        # Если во время подсчёта файлы менялись, не сохраняем - могли посчитать наполовину
+        if FileHandler.data_signature() == before:
+            cache.set(STATS_CACHE_KEY, stats, None)
+        return stats
+
+    @staticmethod
+    def file_written(path, before, changes=None, rebuilt=False):
+        """Обработчик data_file_written: применяет изменения к сохранённой статистике"""
+        with CatalogStats._lock:
+            stats = cache.get(STATS_CACHE_KEY)
+            if stats is None:
+                return
+            if rebuilt or stats['version'] != before:
+                # Снимок собран заново или статистика уже отстала - пересчитаем при чтении
+                cache.delete(STATS_CACHE_KEY)
+                return
+
+            # changes: (источники, (жанр, язык) до изменения или None, после или None)
+            for sources, old, new in changes or ():
+                for source in sources:
+                    if old is not None:
+                        _apply(stats[source], old, -1)
+                    if new is not None:
+                        _apply(stats[source], new, 1)
+
+            name = os.path.basename(path)
+            if name.endswith(DATA_FILE_EXTENSIONS):
+                try:
+                    stats['files'][name] = os.path.getsize(path)
+                except FileNotFoundError:
+                    stats['files'].pop(name, None)
+            _summarize(stats)
+
+            stats['version'] = FileHandler.data_signature()
+            cache.set(STATS_CACHE_KEY, stats, None)
+
+    @staticmethod
+    def clear():
+        cache.delete(STATS_CACHE_KEY)
+
+
+def _summarize(stats):
+    stats['files_count'] = len(stats['files'])
+    stats['files_size'] = sum(stats['files'].values())
@@ -1,3 +1,1197 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import timedelta
+from unittest import mock, skipUnless
+from xml.dom import minidom
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DataError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import metrics
+from .batch import MAX_BATCH_BYTES
+from .export_manager import EXPORT_PREFIX, ExportManager
+from .exporters import JSON_EXPORT_FIELDS, XML_EXPORT_FIELDS, iter_json_export, iter_xml_export
+from .importers import import_books
+from .jobs import ProgressReporter, claim_job, enqueue_export, enqueue_import, get_jobs_path, run_job
+from .models import Book, Job
+from .pagination import decode_cursor, encode_cursor, paginate_queryset, paginate_sorted
+from .search import SQLITE_FTS_TABLE, SQLiteFTSBackend, get_search_backend, search_catalog
+from .search_cache import cached_search
+from .seed import generate_books, seed_db, seed_file
+from .stats import CatalogStats
+from .signals import journal_suppressed
+from .snapshot import CatalogSnapshot
+from .utils import FILE_BOOK_ID_START, DuplicateBookError, FileHandler, books_file_cache
+
+
+class IsolatedDataMixin:
+    """Свой DATA_ROOT на каждый тест, снимок books.json обслуживается сразу, кэши пустые"""
+
+    def setUp(self):
+        super().setUp()
+        data_root = tempfile.mkdtemp(prefix='books-test-')
+        self.addCleanup(shutil.rmtree, data_root, ignore_errors=True)
+        overrides = override_settings(DATA_ROOT=data_root, BOOKS_SNAPSHOT_DELAY=0, BOOKS_BACKGROUND_JOBS=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.clear_caches()
+        self.addCleanup(self.clear_caches)
+
+    @staticmethod
+    def clear_caches():
+        books_file_cache.clear()
+        for cache in caches.all():
+            cache.clear()
+
+
+class CatalogTestCase(IsolatedDataMixin, TestCase):
+    def create_book(self, **fields):
+        """Книга в БД; журнал books.json пишется после фиксации, как в запросе"""
+        data = {'title': 'Тестовая книга', 'author': 'Автор', 'publication_year': 2000, 'genre': 'fiction', 'langua': 'Русский'}
+        data.update(fields)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Book.objects.create(**data)
+
+    def file_books(self):
+        return {record.id: record for record in FileHandler.load_book_records()}
+
+
+class SnapshotTests(CatalogTestCase):
+    def book(self, i):
+        return {'id': i, 'title': f'Книга {i}', 'author': 'Автор', 'publication_year': 2000, 'genre': 'other', 'langua': 'Русский'}
+
+    @override_settings(BOOKS_SNAPSHOT_DELAY=0.2, BOOKS_JOURNAL_MAX_BYTES=0)
+    def test_records_are_coalesced_into_one_flush(self):
+        self.addCleanup(lambda: CatalogSnapshot._timer and CatalogSnapshot._timer.cancel())
+        FileHandler.save_books_to_json([])
+        with mock.patch.object(FileHandler, 'compact_journal', wraps=FileHandler.compact_journal) as compact:
+            for i in range(1, 6):
+                CatalogSnapshot.record([{'op': 'insert', 'book': self.book(i)}])
+            timer = CatalogSnapshot._timer
+            self.assertIsNotNone(timer)
+            self.assertTrue(CatalogSnapshot.is_dirty())
+            compact.assert_not_called()
+
+            timer.join(5)
+            deadline = time.monotonic() + 5
+            while CatalogSnapshot.is_dirty() and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual(compact.call_count, 1)
+        self.assertIsNone(CatalogSnapshot._timer)
+        self.assertEqual(os.path.getsize(FileHandler.get_journal_file_path()), 0)
+        with open(FileHandler.get_json_file_path(), encoding='utf-8') as f:
+            self.assertEqual([book['id'] for book in json.load(f)], [1, 2, 3, 4, 5])
+
+    def test_small_journal_is_not_compacted(self):
+        FileHandler.save_books_to_json([])
+        CatalogSnapshot.record([{'op': 'insert', 'book': self.book(1)}])
+        self.assertGreater(os.path.getsize(FileHandler.get_journal_file_path()), 0)
+        self.assertEqual(list(self.file_books()), [1])
+
+    def test_flush_never_rebuilds_from_the_database_while_a_journal_exists(self):
+        self.create_book(title='В БД')
+        FileHandler.append_to_journal([{'op': 'insert', 'book': self.book(FILE_BOOK_ID_START)}])
+        # books.json ещё не собирался: каталог - это только журнал
+        self.assertFalse(os.path.exists(FileHandler.get_json_file_path()))
+
+        with mock.patch.object(FileHandler, 'save_books_to_json') as rebuild:
+            CatalogSnapshot.mark_dirty()
+        rebuild.assert_not_called()
+        self.assertIn(FILE_BOOK_ID_START, self.file_books())
+
+        # Нет ни снимка, ни журнала - первый снимок собирается из БД
+        os.remove(FileHandler.get_journal_file_path())
+        CatalogSnapshot.flush()
+        self.assertEqual([record.title for record in FileHandler.load_book_records()], ['В БД'])
+
+
+class FileOnlyBookTests(CatalogTestCase):
+    def add_to_file(self, title):
+        form = {'title': title, 'author': 'Автор', 'publication_year': 2001, 'genre': 'other', 'save_location': 'file'}
+        response = self.client.post(reverse('add_book'), form)
+        self.assertRedirects(response, reverse('book_list'), fetch_redirect_response=False)
+
+    def test_file_only_book_does_not_replace_db_book(self):
+        book = self.create_book(title='ААААА')
+        self.add_to_file('Файловая книга')
+
+        books = self.file_books()
+        self.assertEqual(books[book.id].title, 'ААААА')
+        file_only = [record for record in books.values() if record.id != book.id]
+        self.assertEqual([record.title for record in file_only], ['Файловая книга'])
+        self.assertGreaterEqual(file_only[0].id, FILE_BOOK_ID_START)
+
+        # Удаление книги из БД не трогает книгу, которая есть только в файле
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertEqual([record.title for record in self.file_books().values()], ['Файловая книга'])
+
+    def test_file_only_ids_are_unique(self):
+        self.add_to_file('Первая')
+        self.add_to_file('Вторая')
+        ids = sorted(self.file_books())
+        self.assertEqual(ids, [FILE_BOOK_ID_START, FILE_BOOK_ID_START + 1])
+
+
+class DuplicateBookTests(CatalogTestCase):
+    form = {'title': 'Дубль', 'author': 'Автор', 'publication_year': 2001, 'genre': 'other'}
+
+    def add(self, save_location):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('add_book'), dict(self.form, save_location=save_location), follow=True)
+        return [str(message) for message in response.context['messages']]
+
+    def test_file_duplicate_is_rejected(self):
+        self.assertEqual(self.add('file'), ['Книга сохранена в файл!'])
+        self.assertEqual(self.add('file'), ['Такая книга уже есть в файле!'])
+        self.assertEqual(len(self.file_books()), 1)
+
+    def test_concurrent_appends_write_one_book(self):
+        book = {'id': None, 'title': 'Гонка', 'author': 'Автор', 'publication_year': 2001, 'genre': 'other'}
+        barrier = threading.Barrier(6)
+        written = []
+
+        def append():
+            barrier.wait()
+            try:
+                FileHandler.append_to_journal([{'op': 'insert', 'book': dict(book)}], unique=True)
+                written.append(True)
+            except DuplicateBookError:
+                pass
+
+        threads = [threading.Thread(target=append) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(written), 1)
+        self.assertEqual([record.title for record in self.file_books().values()], ['Гонка'])
+
+    def test_both_reports_the_store_that_conflicts(self):
+        with journal_suppressed():
+            Book.objects.create(**self.form)  # книга только в БД
+        self.assertEqual(self.add('both'), ['Такая книга уже существует в базе данных!'])
+        Book.objects.all().delete()
+
+        self.assertEqual(self.add('file'), ['Книга сохранена в файл!'])
+        self.assertEqual(self.add('both'), ['Такая книга уже есть в файле!'])
+        # Книга из файла не попала в БД: транзакция откатилась
+        self.assertFalse(Book.objects.exists())
+
+    def test_both_saves_to_db_and_file(self):
+        self.assertEqual(self.add('both'), ['Книга "Дубль" сохранена и в базу, и в файл!'])
+        book = Book.objects.get()
+        self.assertEqual(self.file_books()[book.id].title, 'Дубль')
+        self.assertEqual(CatalogStats.get()['file']['total'], 1)
+
+
+class ParsedFileCacheTests(CatalogTestCase):
+    def test_new_version_replaces_cached_books(self):
+        self.create_book(title='Первая')
+        first = FileHandler.load_book_records()
+        self.assertIs(FileHandler.load_book_records(), first)
+
+        self.create_book(title='Вторая')
+        self.assertEqual(sorted(record.title for record in FileHandler.load_book_records()), ['Вторая', 'Первая'])
+
+    @override_settings(BOOKS_FILE_CACHE_MAX_BYTES=1)
+    def test_over_the_limit_only_derived_structures_are_evicted(self):
+        self.create_book()
+        books = FileHandler.load_book_records()
+        FileHandler.load_books_sorted()
+        by_id = FileHandler.load_books_by_id()
+
+        # Книги остаются в кэше, из структур - только последняя нужная
+        self.assertIs(FileHandler.load_book_records(), books)
+        self.assertIs(FileHandler.load_books_by_id(), by_id)
+        self.assertEqual(books_file_cache.stats()['derived'], ['by_id'])
+        self.assertEqual(books_file_cache.stats()['evictions'], 1)
+
+
+class ImportTests(CatalogTestCase):
+    def import_json(self, records, **kwargs):
+        payload = io.BytesIO(json.dumps(records, ensure_ascii=False).encode('utf-8'))
+        with self.captureOnCommitCallbacks(execute=True):
+            return import_books(payload, 'json', **kwargs)
+
+    def test_json_import_in_batches(self):
+        records = [{'title': f'Книга {i}', 'author': 'Автор', 'publication_year': 2000 + i} for i in range(5)]
+        result = self.import_json(records, batch_size=2)
+
+        self.assertEqual((result.imported, result.errors), (5, []))
+        self.assertEqual(Book.objects.count(), 5)
+        self.assertEqual(sorted(record.title for record in self.file_books().values()), [f'Книга {i}' for i in range(5)])
+
+    def test_xml_import(self):
+        xml = (
+            '<books><book><title>XML-книга</title><author>Автор</author>'
+            '<publication_year>1999</publication_year><page_count>300</page_count></book></books>'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_books(io.BytesIO(xml.encode('utf-8')), 'xml')
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(Book.objects.get().page_count, 300)
+
+    def test_invalid_records_are_skipped(self):
+        result = self.import_json([
+            {'title': 'Хорошая', 'author': 'Автор', 'publication_year': 2000},
+            {'title': 'Список', 'author': 'Автор', 'publication_year': 2000, 'langua': ['x']},
+            {'title': 'Длинный язык', 'author': 'Автор', 'publication_year': 2000, 'langua': 'x' * 18},
+            {'title': 'Без года', 'author': 'Автор'},
+            {'title': 'Хорошая', 'author': 'Автор', 'publication_year': 2000},
+        ])
+
+        self.assertEqual(result.imported, 1)
+        self.assertEqual([row for row, _ in result.errors], [2, 3, 4, 5])
+        # В журнал попадают только проверенные значения - страницы каталога работают
+        self.assertEqual([record.langua for record in self.file_books().values()], ['Русский'])
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('book_list'), {'source': 'file'}).status_code, 200)
+
+    def test_file_only_books_survive_when_ids_are_not_returned(self):
+        FileHandler.append_to_journal([{'op': 'insert', 'book': {'id': None, 'title': 'Только в файле', 'author': 'Автор',
+                                                                  'publication_year': 2000, 'genre': 'other'}}])
+        bulk_create = Book.objects.bulk_create
+
+        def without_ids(books, **kwargs):
+            created = bulk_create(books, **kwargs)
+            for book in created:
+                book.pk = None
+            return created
+
+        with mock.patch.object(Book.objects, 'bulk_create', side_effect=without_ids):
+            result = self.import_json([{'title': 'Из импорта', 'author': 'Автор', 'publication_year': 2000}])
+
+        self.assertEqual(result.imported, 1)
+        # id нашлись по fingerprint, а не пересборкой books.json из БД
+        books = self.file_books()
+        self.assertEqual(books[Book.objects.get().id].title, 'Из импорта')
+        self.assertEqual(sorted(record.title for record in books.values()), ['Из импорта', 'Только в файле'])
+
+
+class JsonExportTests(CatalogTestCase):
+    def export(self, file_type, **headers):
+        response = self.client.post(reverse('export_books'), {'file_type': file_type}, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_json_array(self):
+        books = [self.create_book(title=f'Книга "{i}"', isbn=None if i else '9785171234567') for i in range(3)]
+        response, body = self.export('json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('books.json', response['Content-Disposition'])
+
+        exported = json.loads(body)
+        self.assertEqual([list(book) for book in exported], [list(JSON_EXPORT_FIELDS)] * 3)
+        self.assertEqual(exported, [FileHandler.book_to_dict(book) for book in books])
+
+    def test_chunks_and_empty_catalog(self):
+        self.assertEqual(json.loads(b''.join(iter_json_export())), [])
+        self.assertEqual(b''.join(iter_json_export(lines=True)), b'')
+
+        for i in range(5):
+            self.create_book(title=f'Книга {i}')
+        chunks = list(iter_json_export(chunk_size=2))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual([book['title'] for book in json.loads(b''.join(chunks))], [f'Книга {i}' for i in range(5)])
+
+    def test_ndjson(self):
+        for i in range(3):
+            self.create_book(title=f'Книга {i}')
+        response, body = self.export('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = body.decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['Книга 0', 'Книга 1', 'Книга 2'])
+
+    def test_gzip_is_negotiated(self):
+        self.create_book()
+        for file_type in ('json', 'ndjson', 'xml'):
+            with self.subTest(file_type=file_type):
+                plain_response, plain = self.export(file_type)
+                self.assertFalse(plain_response.has_header('Content-Encoding'))
+                self.assertIn('Accept-Encoding', plain_response['Vary'])
+
+                response, body = self.export(file_type, HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.8')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertEqual(gzip.decompress(body), plain)
+
+
+def minidom_export():
+    """Прежний экспорт XML (до потоковой записи) - эталон для iter_xml_export"""
+    root = ET.Element('books')
+    for book in Book.objects.all():
+        book_elem = ET.SubElement(root, 'book')
+        for field in XML_EXPORT_FIELDS:
+            value = getattr(book, field)
+            if value is not None:
+                ET.SubElement(book_elem, field).text = str(value)
+    return minidom.parseString(ET.tostring(root, encoding='utf-8')).toprettyxml(indent='  ').encode('utf-8')
+
+
+class XmlExportTests(CatalogTestCase):
+    def test_empty_catalog_matches_minidom(self):
+        self.assertEqual(b''.join(iter_xml_export()), minidom_export())
+
+    def test_output_matches_minidom(self):
+        self.create_book(title='Обычная', isbn='9785171234567', page_count=320, description='Описание')
+        self.create_book(title='Пустые поля', author='Автор', isbn='', langua='', description='')
+        self.create_book(title='Без значений', isbn=None, langua=None, description=None, page_count=None)
+        self.create_book(title='"Кавычки" & <теги>', author="O'Brien", description='строка\r\nещё\rи ещё\n\tотступ')
+
+        self.assertEqual(b''.join(iter_xml_export(chunk_size=2)), minidom_export())
+
+
+class PaginationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = [self.create_book(title=f'Книга {i:02}', publication_year=1990 + i) for i in range(25)]
+
+    def titles(self, page):
+        return [book.title for book in page]
+
+    def test_cursor_pages_cover_the_catalog(self):
+        for source in ('db', 'file'):
+            with self.subTest(source=source):
+                seen, after = [], None
+                while True:
+                    response = self.client.get(reverse('book_list'), {'source': source, 'after': after or ''})
+                    page = response.context['page_obj']
+                    seen += self.titles(page)
+                    if not page.has_next():
+                        break
+                    after = page.next_cursor
+                self.assertEqual(seen, [f'Книга {i:02}' for i in reversed(range(25))])
+
+    def test_previous_cursor_returns_the_same_page(self):
+        first = paginate_queryset(Book.objects.all())
+        second = paginate_queryset(Book.objects.all(), after=first.next_cursor)
+        self.assertEqual(self.titles(paginate_queryset(Book.objects.all(), before=second.previous_cursor)), self.titles(first))
+
+        records, keys = FileHandler.load_books_sorted()
+        second = paginate_sorted(records, keys, after=first.next_cursor)
+        self.assertEqual(self.titles(paginate_sorted(records, keys, before=second.previous_cursor)), self.titles(first))
+
+    def test_malformed_cursor_shows_first_page(self):
+        tokens = ['!!!', encode_cursor('2024-13-45T00:00:00', 1), encode_cursor(None, 1), encode_cursor(1, 2),
+                  encode_cursor('2024-01-01T00:00:00', 'x'), encode_cursor('2024-01-01T00:00:00', True)]
+        first = self.titles(paginate_queryset(Book.objects.all()))
+        for token in tokens:
+            self.assertIsNone(decode_cursor(token))
+            for source in ('db', 'file'):
+                with self.subTest(token=token, source=source):
+                    response = self.client.get(reverse('book_list'), {'source': source, 'after': token, 'before': token})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(self.titles(response.context['page_obj']), first)
+
+
+class FileSearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        for title, author in [('Мастер и Маргарита', 'Булгаков'), ('Мастерская', 'Иванов'), ('Макбет', 'Шекспир'), ('Идиот', 'Достоевский')]:
+            self.create_book(title=title, author=author)
+
+    def test_ngram_index_finds_substrings(self):
+        records, keys, index = FileHandler.load_search_index()
+        self.assertIs(index.records, records)
+        self.assertEqual(keys, [record.sort_key for record in records])
+
+        def found(query, **kwargs):
+            return [records[i].title for i in index.search(query, **kwargs)]
+
+        self.assertEqual(found('мастер'), ['Мастер и Маргарита', 'Мастерская'])
+        self.assertEqual(found('ма', newest_first=True, limit=2), ['Макбет', 'Мастерская'])
+        self.assertEqual(found('шекс'), ['Макбет'])
+        # Все n-граммы есть, но подстроки нет
+        self.assertEqual(found('маргарита иванов'), [])
+
+    def test_index_is_built_once_per_file_version(self):
+        _, _, index = FileHandler.load_search_index()
+        self.assertIs(FileHandler.load_search_index()[2], index)
+
+        self.create_book(title='Маленький принц', author='Сент-Экзюпери')
+        records, _, index = FileHandler.load_search_index()
+        self.assertIn('Маленький принц', [records[i].title for i in index.search('мал')])
+
+    def test_book_list_searches_the_file(self):
+        response = self.client.get(reverse('book_list'), {'source': 'file', 'q': 'Мастер'})
+        self.assertEqual(self.titles(response), ['Мастерская', 'Мастер и Маргарита'])
+
+    def titles(self, response):
+        return [book.title for book in response.context['page_obj']]
+
+
+def fts_triggers():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'books_book' ORDER BY name")
+        return [row[0] for row in cursor.fetchall()]
+
+
+FTS_TRIGGERS = ['books_book_fts_ad', 'books_book_fts_ai', 'books_book_fts_au']
+
+
+def skip_without_fts(test):
+    # Таблицу FTS5 создаёт миграция 0006 в тестовой БД - проверяем уже в ней
+    if connection.vendor != 'sqlite' or SQLITE_FTS_TABLE not in connection.introspection.table_names():
+        test.skipTest('Нужен SQLite с FTS5')
+
+
+class SQLiteFTSTests(CatalogTestCase):
+    def setUp(self):
+        skip_without_fts(self)
+        super().setUp()
+
+    def titles(self, query):
+        return [book.title for book in Book.objects.search(query)]
+
+    def test_backend_is_selected(self):
+        self.assertIsInstance(get_search_backend(), SQLiteFTSBackend)
+        self.assertEqual(fts_triggers(), FTS_TRIGGERS)
+
+    def test_index_follows_insert_update_delete(self):
+        book = self.create_book(title='Вишнёвый сад', author='Чехов')
+        self.assertEqual(self.titles('виш'), ['Вишнёвый сад'])
+        self.assertEqual(self.titles('чехов сад'), ['Вишнёвый сад'])
+        self.assertEqual(self.titles('чехов лес'), [])
+
+        book.title = 'Чайка'
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertEqual(self.titles('сад'), [])
+        self.assertEqual(self.titles('чайк'), ['Чайка'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertEqual(self.titles('чайк'), [])
+
+    def test_bulk_writes_are_indexed(self):
+        import_books(io.BytesIO(json.dumps([{'title': 'Морской волк', 'author': 'Лондон', 'publication_year': 1904}]).encode()), 'json')
+        self.assertEqual(self.titles('морск'), ['Морской волк'])
+        Book.objects.filter(title='Морской волк').update(title='Мартин Иден')
+        self.assertEqual(self.titles('иден'), ['Мартин Иден'])
+
+    def test_results_are_ranked(self):
+        self.create_book(title='Разное', description=' '.join(['слово'] * 50 + ['сад']))
+        self.create_book(title='Сад', author='Садовников', description='Книга про сад')
+        self.assertEqual(self.titles('сад'), ['Сад', 'Разное'])
+
+
+class SearchMigrationTests(IsolatedDataMixin, TransactionTestCase):
+    def setUp(self):
+        skip_without_fts(self)
+        super().setUp()
+
+    def test_triggers_survive_fingerprint_migration(self):
+        # 0009 пересоздаёт books_book (AlterField с UNIQUE), в том числе при откате
+        executor = MigrationExecutor(connection)
+        executor.migrate([('books', '0008_job')])
+        self.assertEqual(fts_triggers(), FTS_TRIGGERS)
+
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes('books'))
+        self.assertEqual(fts_triggers(), FTS_TRIGGERS)
+
+        Book.objects.create(title='После миграции', author='Автор', publication_year=2000, genre='other')
+        self.assertEqual([book.title for book in Book.objects.search('миграц')], ['После миграции'])
+
+
+class SearchCacheTests(CatalogTestCase):
+    # Поиск в БД идёт в потоке пула, а тестовая транзакция ему не видна - ищем только в файле
+    @mock.patch('books.search._search_db', lambda query, limit: [])
+    def test_complete_results_are_reused_for_longer_queries(self):
+        self.create_book(title='Мастер и Маргарита', author='Булгаков')
+        with mock.patch('books.search_cache.search_catalog', wraps=search_catalog) as search:
+            self.assertEqual([item['title'] for item in cached_search('мас')], ['Мастер и Маргарита'])
+            self.assertEqual([item['title'] for item in cached_search('мастер')], ['Мастер и Маргарита'])
+            self.assertEqual(cached_search('мастер'), cached_search('Мастер '))
+        self.assertEqual(search.call_count, 1)
+
+    def test_results_without_db_answer_are_not_cached(self):
+        partial = ([{'title': 'Из файла', 'source': 'file', '_text': 'из файла'}], False, False)
+        with mock.patch('books.search_cache.search_catalog', return_value=partial) as search:
+            cached_search('из файла')
+            cached_search('из файла')
+        self.assertEqual(search.call_count, 2)
+
+    def test_slow_db_is_abandoned(self):
+        for i in range(20):
+            self.create_book(title=f'Книга {i}', author='Автор')
+
+        def slow_db(query, limit):
+            time.sleep(0.5)
+            return []
+
+        with override_settings(BOOKS_SEARCH_GRACE=0), mock.patch('books.search._search_db', slow_db):
+            results, complete, answered = search_catalog('книга')
+        self.assertEqual(len(results), 15)
+        self.assertFalse(complete)
+        self.assertFalse(answered)
+
+
+@override_settings(BOOKS_METRICS=True)
+class RequestMetricsTests(CatalogTestCase):
+    def query_count(self, view):
+        histogram = metrics.registry.histograms('books_request_db_queries').get((('view', view),))
+        return histogram and histogram.sum
+
+    def test_search_queries_from_the_pool_thread_are_counted(self):
+        metrics.registry.reset()
+        response = self.client.get(reverse('search_books_ajax'), {'q': 'мастер'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.query_count('search_books_ajax'), 0)
+
+
+class SeedTests(CatalogTestCase):
+    def test_seed_db_writes_books_json_once(self):
+        with mock.patch.object(FileHandler, '_write_snapshot', wraps=FileHandler._write_snapshot) as write:
+            seed_db(50, batch_size=10)
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(set(self.file_books()), set(Book.objects.values_list('id', flat=True)))
+        self.assertEqual(os.path.getsize(FileHandler.get_journal_file_path()), 0)
+
+    def test_seed_file_ids_do_not_collide(self):
+        book = self.create_book()
+        seed_file(30, batch_size=7)
+        books = self.file_books()
+        self.assertEqual(len(books), 31)
+        self.assertEqual(sorted(books)[1:], list(range(FILE_BOOK_ID_START, FILE_BOOK_ID_START + 30)))
+        self.assertEqual(books[book.id].title, book.title)
+
+    def test_seed_without_journal_changes_catalog_version(self):
+        self.create_book()
+        self.assertEqual(CatalogStats.get()['db']['total'], 1)
+        version = FileHandler.data_signature()
+        seed_db(5, journal=False)
+        self.assertNotEqual(FileHandler.data_signature(), version)
+        self.assertEqual(CatalogStats.get()['db']['total'], 6)
+        self.assertEqual(CatalogStats.get()['file']['total'], 1)
+
+    def test_generated_dates_are_kept_without_touching_the_model(self):
+        field = Book._meta.get_field('created_at')
+        bulk_create = Book.objects.bulk_create
+
+        def checked(books, **kwargs):
+            # Другие запросы в это время создают книги с текущей датой
+            self.assertTrue(field.auto_now_add)
+            return bulk_create(books, **kwargs)
+
+        with mock.patch.object(Book.objects, 'bulk_create', side_effect=checked):
+            seed_db(20, batch_size=6)
+        # Даты из генератора: идут в его порядке и в прошлом, а не время вставки
+        books = list(Book.objects.order_by('created_at'))
+        self.assertEqual([book.title for book in books], [book['title'] for book in generate_books(20)])
+        self.assertLess(books[-1].created_at, timezone.now() - timedelta(days=30))
+        records = self.file_books()
+        for book in books:
+            self.assertEqual(records[book.id].created_at, book.created_at.isoformat())
+
+
+class BatchApiTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_user('staff', is_staff=True))
+
+    def post(self, payload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('books_batch'), json.dumps(payload), content_type='application/json')
+
+    def test_only_staff_with_csrf_token_and_json_body(self):
+        book = self.create_book()
+        body = json.dumps({'delete': [book.id]})
+        self.client.logout()
+        self.assertEqual(self.client.post(reverse('books_batch'), body, content_type='application/json').status_code, 403)
+
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(get_user_model().objects.get(username='staff'))
+        self.assertEqual(client.post(reverse('books_batch'), body, content_type='text/plain').status_code, 403)
+        self.assertEqual(client.post(reverse('books_batch'), body, content_type='application/json').status_code, 403)
+
+        client.get(reverse('add_book'))  # страница с формой выставляет cookie csrftoken
+        headers = {'HTTP_X_CSRFTOKEN': client.cookies['csrftoken'].value}
+        response = client.post(reverse('books_batch'), body, content_type='text/plain', **headers)
+        self.assertEqual(response.status_code, 415)
+        response = client.post(reverse('books_batch'), body, content_type='application/json',
+                               CONTENT_LENGTH=str(MAX_BATCH_BYTES + 1), **headers)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(Book.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('books_batch'), body, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Book.objects.count(), 0)
+
+    def test_batch_is_journaled_with_one_write(self):
+        books = [self.create_book(title=f'Книга {i}') for i in range(3)]
+        with mock.patch.object(FileHandler, 'append_to_journal', wraps=FileHandler.append_to_journal) as append:
+            response = self.post({'delete': [book.id for book in books[:2]], 'update': [{'id': books[2].id, 'title': 'Другая'}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(append.call_count, 1)
+        self.assertEqual({record.title for record in self.file_books().values()}, {'Другая'})
+        self.assertEqual(CatalogStats.get()['db']['total'], 1)
+
+    def test_create_update_delete(self):
+        kept, removed = self.create_book(title='Старая'), self.create_book(title='Лишняя')
+        response = self.post({
+            'create': [{'title': 'Новая', 'author': 'Автор', 'publication_year': 2020}],
+            'update': [{'id': kept.id, 'title': 'Обновлённая'}],
+            'delete': [removed.id],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result['updated'], result['deleted'], len(result['created'])), (1, 1, 1))
+        titles = {book.id: book.title for book in self.file_books().values()}
+        self.assertEqual(titles, {kept.id: 'Обновлённая', result['created'][0]: 'Новая'})
+        self.assertEqual(CatalogStats.get()['file']['total'], 2)
+
+    def test_malformed_create_is_rejected(self):
+        self.create_book()
+        for book in (
+            {'title': 'Zzz2', 'author': 'A', 'publication_year': 2000, 'langua': ['x']},
+            {'title': 'Zzz2', 'author': 'A', 'publication_year': 2000, 'langua': 'x' * 18},
+            {'title': 'Zzz2', 'author': 'A', 'publication_year': 2000, 'isbn': '978-5-17-123456-7-' * 2},
+            {'title': 'Zzz2', 'author': 'A', 'publication_year': 2000, 'description': {'text': 'x'}},
+        ):
+            with self.subTest(book=book):
+                response = self.post({'create': [book]})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['errors'][0]['op'], 'create')
+
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(len(self.file_books()), 1)
+        for url in (reverse('home'), reverse('book_list')):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_malformed_update_is_rejected(self):
+        book = self.create_book()
+        response = self.post({'update': [{'id': book.id, 'langua': ['x']}, {'id': book.id + 1, 'title': 'Нет такой'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 0])
+        self.assertEqual(Book.objects.get().langua, 'Русский')
+
+    def test_duplicates_are_rejected(self):
+        self.create_book(title='Есть')
+        book = {'title': 'Новая', 'author': 'Автор', 'publication_year': 2000}
+        response = self.post({'create': [book, dict(book, title='  НОВАЯ ')]})
+        self.assertEqual(response.status_code, 400)
+        response = self.post({'create': [{'title': 'есть', 'author': 'Автор', 'publication_year': 2000}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_database_error_is_a_bad_request(self):
+        with mock.patch.object(Book.objects, 'bulk_create', side_effect=DataError('value too long')):
+            response = self.post({'create': [{'title': 'Новая', 'author': 'Автор', 'publication_year': 2000}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('value too long', response.json()['errors'][0]['error'])
+
+
+class ReadApiTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = [self.create_book(title=f'Книга {i}', genre='fantasy' if i % 2 else 'science') for i in range(5)]
+
+    def get(self, **params):
+        return self.client.get(reverse('api_books'), params)
+
+    def test_pages_with_selected_fields(self):
+        for source in ('db', 'file'):
+            with self.subTest(source=source):
+                first = self.get(source=source, fields='title', limit=3).json()
+                self.assertEqual(first['results'], [{'title': 'Книга 4'}, {'title': 'Книга 3'}, {'title': 'Книга 2'}])
+                second = self.get(source=source, fields='title', limit=3, after=first['next']).json()
+                self.assertEqual(second, {'results': [{'title': 'Книга 1'}, {'title': 'Книга 0'}], 'next': None})
+
+    def test_filters_and_single_book(self):
+        for source in ('db', 'file'):
+            with self.subTest(source=source):
+                results = self.get(source=source, genre='fantasy', fields='id').json()['results']
+                self.assertEqual(results, [{'id': self.books[3].id}, {'id': self.books[1].id}])
+
+                response = self.client.get(reverse('api_book', args=[self.books[0].id]), {'source': source, 'fields': 'title,genre'})
+                self.assertEqual(response.json(), {'title': 'Книга 0', 'genre': 'science'})
+        self.assertEqual(self.client.get(reverse('api_book', args=[10 ** 9])).status_code, 404)
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({'fields': 'title,password'}, {'year': 'abc'}, {'limit': 'x'},
+                       {'after': encode_cursor('2024-13-45T00:00:00', 1)}, {'after': encode_cursor(None, 1)},
+                       {'after': 'not-a-cursor'}):
+            for source in ('db', 'file'):
+                with self.subTest(params=params, source=source):
+                    response = self.get(source=source, **params)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', response.json())
+
+
+class JournalTests(CatalogTestCase):
+    def book(self, id, title):
+        return {'id': id, 'title': title, 'author': 'Автор', 'publication_year': 2000, 'genre': 'other', 'langua': 'Русский'}
+
+    def titles(self):
+        return [book['title'] for book in FileHandler._read_books()]
+
+    def test_journal_is_replayed_over_the_snapshot(self):
+        FileHandler.save_books_to_json([self.book(1, 'Первая'), self.book(2, 'Вторая'), self.book(3, 'Третья')])
+        FileHandler.append_to_journal([
+            {'op': 'update', 'book': self.book(2, 'Вторая, исправленная')},
+            {'op': 'delete', 'id': 1},
+            {'op': 'insert', 'book': self.book(4, 'Четвёртая')},
+        ])
+        self.assertEqual(self.titles(), ['Вторая, исправленная', 'Третья', 'Четвёртая'])
+        self.assertEqual(sorted(self.file_books()), [2, 3, 4])
+
+    def test_truncated_last_line_is_ignored(self):
+        FileHandler.save_books_to_json([self.book(1, 'Первая')])
+        FileHandler.append_to_journal([{'op': 'insert', 'book': self.book(2, 'Вторая')}])
+        # Процесс упал посреди записи: последняя строка журнала недописана
+        with open(FileHandler.get_journal_file_path(), 'a', encoding='utf-8') as f:
+            f.write('{"op": "insert", "book": {"id": 3, "tit')
+        self.assertEqual(self.titles(), ['Первая', 'Вторая'])
+
+    def test_compaction_keeps_the_books_and_empties_the_journal(self):
+        FileHandler.save_books_to_json([self.book(1, 'Первая')])
+        FileHandler.append_to_journal([{'op': 'insert', 'book': self.book(2, 'Вторая')}, {'op': 'delete', 'id': 1}])
+        journal_path = FileHandler.get_journal_file_path()
+
+        self.assertFalse(FileHandler.compact_journal(min_bytes=os.path.getsize(journal_path) + 1))
+        self.assertTrue(FileHandler.compact_journal())
+        self.assertEqual(os.path.getsize(journal_path), 0)
+        with open(FileHandler.get_json_file_path(), encoding='utf-8') as f:
+            self.assertEqual([book['title'] for book in json.load(f)], ['Вторая'])
+        self.assertEqual([record.title for record in FileHandler.load_book_records()], ['Вторая'])
+        self.assertFalse(FileHandler.compact_journal())
+
+    def test_new_version_is_seen_after_append(self):
+        FileHandler.save_books_to_json([self.book(1, 'Первая')])
+        self.assertEqual(sorted(self.file_books()), [1])
+        FileHandler.append_to_journal([{'op': 'insert', 'book': self.book(2, 'Вторая')}])
+        self.assertEqual(sorted(self.file_books()), [1, 2])
+
+
+class ViewFileTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.filename = 'books.json'
+        self.content = ('["' + 'ёж' * 50 + '"]').encode('utf-8')
+        with open(os.path.join(FileHandler.get_data_path(), self.filename), 'wb') as f:
+            f.write(self.content)
+
+    def get_raw(self, **headers):
+        return self.client.get(reverse('view_file', args=[self.filename]), {'raw': 1}, **headers)
+
+    def test_whole_file_and_ranges(self):
+        response = self.get_raw()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        size = len(self.content)
+        for header, start, end in (('bytes=2-9', 2, 9), ('bytes=10-', 10, size - 1), ('bytes=-5', size - 5, size - 1),
+                                   (f'bytes=0-{size + 100}', 0, size - 1)):
+            with self.subTest(range=header):
+                response = self.get_raw(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+                self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1])
+
+    def test_unsatisfiable_range(self):
+        response = self.get_raw(HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_chunks_do_not_split_characters(self):
+        path = os.path.join(FileHandler.get_data_path(), self.filename)
+        pieces = []
+        offset = 3  # внутри второго символа «ё» (2 байта на символ кириллицы)
+        while offset < len(self.content):
+            text, start, end = FileHandler.read_text_chunk(path, offset, size=7)
+            self.assertLessEqual(start, offset)
+            self.assertGreater(end, start)
+            pieces.append((start, end, text))
+            offset = end
+        self.assertEqual(pieces[0][0], 2)
+        self.assertEqual(''.join(text for _, _, text in pieces), self.content[2:].decode('utf-8'))
+        for start, end, text in pieces:
+            self.assertEqual(text.encode('utf-8'), self.content[start:end])
+
+    def test_page_offset(self):
+        response = self.client.get(reverse('view_file', args=[self.filename]), {'offset': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['start'], 2)
+        self.assertEqual(response.context['end'], len(self.content))
+        self.assertIsNone(response.context['next_offset'])
+        self.assertEqual(self.client.get(reverse('view_file', args=[self.filename]), {'offset': 'x'}).context['start'], 0)
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_book()
+
+    def test_unchanged_catalog_is_not_modified(self):
+        for url in (reverse('home'), reverse('book_list')):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('no-cache', response['Cache-Control'])
+                etag = response['ETag']
+
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                # Другой воркер или процесс после рестарта: кэши пустые, ETag тот же
+                self.clear_caches()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+                self.create_book(title=f'Ещё одна для {url}')
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_export_download_is_not_modified(self):
+        response = self.client.get(reverse('export_download', args=['json']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book['title'] for book in json.loads(b''.join(response.streaming_content))], ['Тестовая книга'])
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('export_download', args=['json']), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(reverse('export_download', args=['xml']), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('export_download', args=['csv'])).status_code, 404)
+
+    def test_seeding_without_journal_changes_etag(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        seed_db(3, journal=False)
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BookRowCacheTests(CatalogTestCase):
+    def edit(self, book, **fields):
+        data = {**FileHandler.book_to_dict(book), 'save_location': 'db', **fields}
+        data = {key: value for key, value in data.items() if value is not None}
+        response = self.client.post(reverse('edit_book', args=[book.pk]), data)
+        self.assertRedirects(response, reverse('book_list'), fetch_redirect_response=False)
+
+    def book_list(self):
+        return self.client.get(reverse('book_list'), {'source': 'db'})
+
+    def test_edited_book_row_is_rendered_again(self):
+        book = self.create_book(title='Старое название', genre='fiction')
+        self.assertContains(self.book_list(), 'Старое название')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.edit(book, title='Новое название', genre='history')
+        response = self.book_list()
+        self.assertContains(response, 'Новое название')
+        self.assertContains(response, 'История')
+        self.assertNotContains(response, 'Старое название')
+
+    def test_unchanged_row_comes_from_the_cache(self):
+        # Версия строки не меняется - значит, строка берётся из кэша фрагментов, а не из книги
+        book = self.create_book(title='Старое название')
+        with mock.patch('books.models.book_cache_version', return_value='fixed'):
+            self.assertContains(self.book_list(), 'Старое название')
+            Book.objects.filter(pk=book.pk).update(title='Новое название')
+            self.assertContains(self.book_list(), 'Старое название')
+
+
+class CatalogStatsTests(CatalogTestCase):
+    def test_edit_moves_the_book_between_counters_without_select(self):
+        self.create_book(title='Первая', genre='fiction', langua='Русский')
+        self.create_book(title='Вторая', genre='fiction', langua='English')
+        self.assertEqual(CatalogStats.get()['db']['genres'], {'fiction': 2})
+
+        book = Book.objects.get(langua='English')
+        book.genre = 'science'
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+
+        stats = CatalogStats.get()
+        for source in ('db', 'file'):
+            self.assertEqual(stats[source]['genres'], {'fiction': 1, 'science': 1})
+        # Тот же объект ещё раз: сравнивается уже с сохранёнными значениями
+        book.genre = 'history'
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertEqual(CatalogStats.get()['db']['genres'], {'fiction': 1, 'history': 1})
+        self.assertEqual(CatalogStats.get(), CatalogStats.recompute())
+
+    def test_book_without_loaded_values(self):
+        book = self.create_book(genre='fiction')
+        with self.captureOnCommitCallbacks(execute=True):
+            Book(pk=book.pk, title=book.title, author=book.author, publication_year=2000, genre='science',
+                 created_at=book.created_at).save()
+        self.assertEqual(CatalogStats.get()['db']['genres'], {'science': 1})
+        self.assertEqual(CatalogStats.get(), CatalogStats.recompute())
+
+    def test_recompute_command_changes_the_catalog_version(self):
+        self.create_book()
+        version = CatalogStats.get()['version']
+        # Изменение в обход сигналов - статистика во всех процессах устарела
+        Book.objects.update(genre='science')
+
+        call_command('recompute_stats', stdout=io.StringIO())
+        # Другой процесс хранит статистику с прежней версией и пересчитает её
+        self.assertNotEqual(FileHandler.data_signature(), version)
+        self.assertEqual(CatalogStats.get()['db']['genres'], {'science': 1})
+
+    def test_context_processor(self):
+        self.create_book()
+        self.create_book(title='Ещё одна')
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['catalog_stats']['db']['total'], 2)
+        self.assertContains(response, 'Книг в базе: <strong>2</strong>', html=False)
+
+        # Страница, где статистика не выводится, её не считает
+        self.clear_caches()
+        with mock.patch.object(CatalogStats, 'recompute') as recompute:
+            self.client.get(reverse('upload_file'))
+        recompute.assert_not_called()
+
+
+class ExportManagerTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_book(title='Первая')
+        self.build = mock.Mock(side_effect=iter_json_export)
+
+    def export(self):
+        file_path, chunks = ExportManager.export('json', self.build)
+        return file_path, b''.join(chunks)
+
+    def exports(self):
+        return sorted(name for name in os.listdir(FileHandler.get_data_path()) if name.startswith(EXPORT_PREFIX))
+
+    def test_same_version_reuses_the_artifact(self):
+        first_path, first = self.export()
+        second_path, second = self.export()
+        self.assertEqual((second_path, second), (first_path, first))
+        self.assertEqual(self.build.call_count, 1)
+        self.assertEqual([book['title'] for book in json.loads(second)], ['Первая'])
+        self.assertIn(os.path.basename(first_path), ExportManager.read_index())
+
+    def test_changed_catalog_gets_a_new_artifact(self):
+        first_path, _ = self.export()
+        self.create_book(title='Вторая')
+        second_path, body = self.export()
+        self.assertNotEqual(second_path, first_path)
+        self.assertEqual(self.build.call_count, 2)
+        self.assertEqual(sorted(book['title'] for book in json.loads(body)), ['Вторая', 'Первая'])
+
+    def test_artifact_changed_during_export_is_dropped(self):
+        def build():
+            yield b'['
+            self.create_book(title='Во время выгрузки')
+            yield b']'
+
+        self.build.side_effect = build
+        file_path, _ = self.export()
+        self.assertFalse(os.path.exists(file_path))
+        self.assertEqual(ExportManager.read_index(), {})
+
+    def test_retention(self):
+        names = []
+        for i in range(3):
+            self.create_book(title=f'Книга {i}')
+            names.append(os.path.basename(self.export()[0]))
+        self.assertEqual(self.exports(), sorted(names))
+
+        # Самые старые уходят первыми, keep не трогается
+        self.assertEqual(ExportManager.cleanup(max_count=1, keep=(names[0],)), [names[1]])
+        self.assertEqual(self.exports(), sorted([names[0], names[2]]))
+        self.assertEqual(set(ExportManager.read_index()), {names[0], names[2]})
+
+        size = os.path.getsize(os.path.join(FileHandler.get_data_path(), names[2]))
+        self.assertEqual(ExportManager.cleanup(max_bytes=size), [names[0]])
+        self.assertEqual(ExportManager.cleanup(now=time.time() + 100, max_age=50), [names[2]])
+        self.assertEqual(self.exports(), [])
+
+    def test_stale_tmp_files_are_removed(self):
+        data_path = FileHandler.get_data_path()
+        stale, fresh = f'{EXPORT_PREFIX}old.json.1.tmp', f'{EXPORT_PREFIX}new.json.2.tmp'
+        for name in (stale, fresh):
+            open(os.path.join(data_path, name), 'w').close()
+        old = time.time() - 2 * 60 * 60
+        os.utime(os.path.join(data_path, stale), (old, old))
+        self.assertEqual(ExportManager.cleanup(), [stale])
+        self.assertEqual(self.exports(), [fresh])
+
+    def test_cleanup_command(self):
+        self.export()
+        output = io.StringIO()
+        call_command('cleanup_exports', max_count=0, stdout=output)
+        self.assertIn('Удалено файлов: 1', output.getvalue())
+        self.assertEqual(self.exports(), [])
+
+
+class JobTests(CatalogTestCase):
+    def make_stale(self, job):
+        Job.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(seconds=settings.BOOKS_JOBS_STALE_AFTER + 1))
+
+    def enqueue_upload(self, books):
+        upload = SimpleUploadedFile('books.json', json.dumps(books, ensure_ascii=False).encode('utf-8'))
+        return enqueue_import(upload, 'json')
+
+    def test_job_is_claimed_once(self):
+        job = enqueue_export('json')
+        self.assertEqual(claim_job('first'), job)
+        self.assertIsNone(claim_job('second'))
+        self.assertEqual(Job.objects.get().worker, 'first')
+
+    def test_stale_export_is_claimed_again(self):
+        job = enqueue_export('json')
+        first = claim_job('first')
+        self.make_stale(job)
+
+        self.assertEqual(claim_job('second'), job)
+        # Первый воркер ожил, но задача уже не его - прогресс не пишется
+        ProgressReporter(first)(10, force=True)
+        job.refresh_from_db()
+        self.assertEqual((job.worker, job.status, job.progress), ('second', Job.STATUS_RUNNING, 0))
+
+    def test_stale_import_fails_and_its_upload_is_removed(self):
+        job = self.enqueue_upload([{'title': 'Книга', 'author': 'Автор', 'publication_year': 2000}])
+        claim_job('first')
+        self.make_stale(job)
+
+        self.assertIsNone(claim_job('second'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertFalse(os.path.exists(job.params['path']))
+        self.assertEqual(os.listdir(get_jobs_path()), [])
+
+    def test_run_import(self):
+        job = self.enqueue_upload([
+            {'title': 'Первая', 'author': 'Автор', 'publication_year': 2000},
+            {'title': 'Без года', 'author': 'Автор'},
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            run_job(claim_job('worker'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertIn('Импортировано 1 книг', job.message)
+        self.assertIn('запись 2', job.message)
+        self.assertEqual([record.title for record in self.file_books().values()], ['Первая'])
+        self.assertFalse(os.path.exists(job.params['path']))
+
+    def test_run_export_and_download(self):
+        self.create_book(title='Первая')
+        self.create_book(title='Вторая')
+        job = enqueue_export('ndjson')
+        run_job(claim_job('worker'))
+
+        status = self.client.get(reverse('job_status', args=[job.pk]), {'format': 'json'}).json()
+        self.assertEqual((status['status'], status['percent']), (Job.STATUS_DONE, 100))
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(sorted(json.loads(line)['title'] for line in lines), ['Вторая', 'Первая'])
+
+    def test_failed_job_reports_the_error(self):
+        job = enqueue_export('json')
+        with mock.patch.object(ExportManager, 'export', side_effect=OSError('диск заполнен')):
+            run_job(claim_job('worker'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn('диск заполнен', job.message)
+        self.assertEqual(self.client.get(reverse('job_download', args=[job.pk])).status_code, 404)
+
+    @override_settings(BOOKS_BACKGROUND_JOBS=True)
+    def test_views_enqueue_jobs(self):
+        response = self.client.post(reverse('export_books'), {'file_type': 'json'})
+        export = Job.objects.get(kind=Job.KIND_EXPORT)
+        self.assertRedirects(response, reverse('job_status', args=[export.pk]))
+        self.assertEqual(export.params, {'format': 'json'})
+
+        upload = SimpleUploadedFile('books.json', b'[]', content_type='application/json')
+        response = self.client.post(reverse('upload_file'), {'file': upload, 'file_type': 'json'})
+        job = Job.objects.get(kind=Job.KIND_IMPORT)
+        self.assertRedirects(response, reverse('job_status', args=[job.pk]))
+        self.assertTrue(os.path.exists(job.params['path']))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Пул соединений (books.db_pool) есть только для PostgreSQL')
+@override_settings(BOOKS_METRICS=True)
+class ConnectionPoolTests(TransactionTestCase):
+    """Запуск с PostgreSQL из docker-compose: docker compose run web python manage.py test books"""
+
+    def make_wrapper(self, alias, size=1, timeout=0.2):
+        from .db_pool.base import DatabaseWrapper, close_pools
+
+        settings_dict = {
+            **connection.settings_dict,
+            'ENGINE': 'books.db_pool',
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': True,
+            'POOL': {'SIZE': size, 'TIMEOUT': timeout},
+        }
+        wrapper = DatabaseWrapper(settings_dict, alias=alias)
+        # Соединения пула к тестовой БД не должны мешать её удалению
+        self.addCleanup(close_pools, alias)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def backend_pid(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_connection_is_reused(self):
+        wrapper = self.make_wrapper('pool_reuse')
+        pid = self.backend_pid(wrapper)
+        wrapper.close()
+        self.assertEqual(self.backend_pid(wrapper), pid)
+
+    def test_broken_connection_is_replaced(self):
+        wrapper = self.make_wrapper('pool_health')
+        pid = self.backend_pid(wrapper)
+        wrapper.close()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+            # pg_terminate_backend только посылает сигнал - ждём, пока процесс завершится
+            for _ in range(50):
+                cursor.execute('SELECT count(*) FROM pg_stat_activity WHERE pid = %s', [pid])
+                if not cursor.fetchone()[0]:
+                    break
+                time.sleep(0.1)
+
+        self.assertNotEqual(self.backend_pid(wrapper), pid)
+
+    def test_wait_time_is_measured(self):
+        from .db_pool.base import PoolTimeout
+
+        labels = (('alias', 'pool_wait'),)
+        waits = metrics.registry.histograms('books_db_pool_wait_seconds')
+        count_before = waits[labels].count if labels in waits else 0
+
+        first = self.make_wrapper('pool_wait')
+        second = self.make_wrapper('pool_wait')
+        pid = self.backend_pid(first)  # единственное соединение пула занято
+
+        started = time.perf_counter()
+        with self.assertRaises(PoolTimeout):
+            second.ensure_connection()
+        self.assertGreaterEqual(time.perf_counter() - started, 0.2)
+        self.assertEqual(metrics.registry.counters('books_db_pool_timeouts_total')[labels], 1)
+
+        first.close()
+        self.assertEqual(self.backend_pid(second), pid)
+
+        histogram = metrics.registry.histograms('books_db_pool_wait_seconds')[labels]
+        self.assertEqual(histogram.count, count_before + 3)
+        self.assertGreaterEqual(histogram.sum, 0.2)
@@ -8,8 +8,16 @@ urlpatterns = [
     path('books/<int:book_id>/edit/', views.edit_book, name='edit_book'),
     path('books/<int:book_id>/delete/', views.delete_book, name='delete_book'),
     path('export/', views.export_books, name='export_books'),
+    path('export/<str:file_type>/', views.export_download, name='export_download'),
     path('upload/', views.upload_file, name='upload_file'),
     path('files/', views.file_list, name='file_list'),
     path('files/<str:filename>/', views.view_file, name='view_file'),
+    path('api/books/', views.api_books, name='api_books'),
+    path('api/books/<int:book_id>/', views.api_book, name='api_book'),
+    path('api/books/batch/', views.books_batch, name='books_batch'),
     path('search/ajax/', views.search_books_ajax, name='search_books_ajax'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('metrics/dashboard/', views.metrics_dashboard, name='metrics_dashboard'),
 ]
\ No newline at end of file
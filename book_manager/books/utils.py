@@ -1,11 +1,50 @@
 import json
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import os
+import threading
+import time
 import uuid
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager, nullcontext
 from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import Signal
+
+from .metrics import observe_file_io
+from .models import GENRE_LABELS, book_cache_version, book_fingerprint
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Отправляется после записи в каталог данных (под блокировкой books.json, если она
+# была взята). Аргументы: path, before - data_signature() до записи, changes -
+# изменения каталога для статистики, rebuilt - снимок пересобран целиком
+data_file_written = Signal()
+
+# Файлы каталога данных, которые показываются пользователю
+DATA_FILE_EXTENSIONS = ('.json', '.xml')
+
+# Превью в списке файлов: сколько символов показываем и сколько байт ради них читаем
+PREVIEW_CHARS = 200
+PREVIEW_BYTES = 1024
+
+# Сколько байт файла показывается на одной странице просмотра
+VIEW_CHUNK_BYTES = 64 * 1024
+
+# id книг, которые есть только в файле: отдельный диапазон, чтобы не совпасть с id из БД
+FILE_BOOK_ID_START = 10 ** 12
+
+
+class DuplicateBookError(Exception):
+    """В books.json уже есть книга с тем же book_fingerprint (append_to_journal с unique=True)"""
 
 class FileHandler:
+    # (подпись файлов после записи, последний выданный id книги только из файла): следующая
+    # запись этого же процесса (пакеты seed_file) не разбирает файл ради id заново
+    _last_file_id = None
+
     @staticmethod
     def get_data_path():
         # Используем DATA_ROOT из настроек
@@ -17,75 +56,239 @@ class FileHandler:
     def get_json_file_path():
         return os.path.join(FileHandler.get_data_path(), 'books.json')
 
-    # Остальной код остается без изменений...
+    @staticmethod
+    def get_journal_file_path():
+        # Журнал изменений books.json: одна JSON-запись (insert/update/delete) на строку
+        return os.path.join(FileHandler.get_data_path(), 'books.journal.jsonl')
+
+    @staticmethod
+    def book_to_dict(book):
+        return {
+            'id': book.id,
+            'title': book.title,
+            'author': book.author,
+            'isbn': book.isbn,
+            'publication_year': book.publication_year,
+            'genre': book.genre,
+            'langua': book.langua,
+            'page_count': book.page_count,
+            'description': book.description,
+            'created_at': book.created_at.isoformat(),
+        }
+
+    @staticmethod
+    @contextmanager
+    def _locked(shared=False):
+        """Межпроцессная блокировка books.json и журнала (несколько воркеров gunicorn)"""
+        lock_path = os.path.join(FileHandler.get_data_path(), 'books.json.lock')
+        with open(lock_path, 'a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
 
     @staticmethod
     def save_books_to_json(books_data=None):
         if books_data is None:
             from .models import Book
-            books = Book.objects.all()
-            books_data = []
-            for book in books:
-                books_data.append({
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'isbn': book.isbn,
-                    'publication_year': book.publication_year,
-                    'genre': book.genre,
-                    'langua': book.langua,
-                    'page_count': book.page_count,
-                    'description': book.description,
-                    'created_at': book.created_at.isoformat(),
-                })
+            books_data = [FileHandler.book_to_dict(book) for book in Book.objects.all()]
+
+        with FileHandler._locked():
+            before = FileHandler.data_signature()
+            file_path = FileHandler._write_snapshot(books_data)
+            # Снимок собран заново - накопленный журнал больше не нужен
+            open(FileHandler.get_journal_file_path(), 'w').close()
+            data_file_written.send(sender=FileHandler, path=file_path, before=before, rebuilt=True)
+        return file_path
 
+    @staticmethod
+    def _write_snapshot(books_data):
+        # Пишем во временный файл и подменяем, чтобы читатели не увидели файл наполовину
+        started = time.perf_counter()
         file_path = FileHandler.get_json_file_path()
-        with open(file_path, 'w', encoding='utf-8') as f:
+        tmp_path = f'{file_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(books_data, f, ensure_ascii=False, indent=2)
+            size = f.tell()
+        os.replace(tmp_path, file_path)
+        observe_file_io('write', started, size)
         return file_path
 
+    @staticmethod
+    def append_to_journal(entries, changes=None, unique=False):
+        """Дописывает изменения в журнал, не переписывая books.json.
+
+        Новым книгам без id (только в файле) id выдаётся здесь же, под блокировкой.
+        С unique=True новые книги сверяются с файлом под той же блокировкой: если такая
+        уже есть, ничего не пишется и поднимается DuplicateBookError
+        """
+        started = time.perf_counter()
+        journal_path = FileHandler.get_journal_file_path()
+        with FileHandler._locked():
+            if unique:
+                FileHandler._check_unique(entries)
+            last_id = FileHandler._assign_file_ids(entries)
+            lines = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries).encode('utf-8')
+            before = FileHandler.data_signature()
+            with open(journal_path, 'ab') as f:
+                f.write(lines)
+            if last_id is not None:
+                FileHandler._last_file_id = (ParsedFileCache.signature(), last_id)
+            observe_file_io('append', started, len(lines))
+            data_file_written.send(sender=FileHandler, path=journal_path, before=before, changes=changes)
+
+    @staticmethod
+    def _check_unique(entries):
+        # Блокировка уже взята - читаем файл без неё, как в _assign_file_ids
+        known = books_file_cache.derive('fingerprints', _book_fingerprints, lock=False)
+        for entry in entries:
+            if entry['op'] == 'insert':
+                book = entry['book']
+                if book_fingerprint(book['title'], book['author'], book['publication_year']) in known:
+                    raise DuplicateBookError(f"Книга «{book['title']}» уже есть в books.json")
+
+    @staticmethod
+    def _assign_file_ids(entries):
+        """Выдаёт id новым книгам без id; возвращает последний выданный или None"""
+        new_books = [entry['book'] for entry in entries if entry['op'] == 'insert' and entry['book'].get('id') is None]
+        if not new_books:
+            return None
+        last = FileHandler._last_file_id
+        if last is not None and last[0] == ParsedFileCache.signature():
+            # С нашей прошлой записи файлы никто не менял
+            next_id = last[1] + 1
+        else:
+            # Блокировка уже взята - читаем файл без неё, иначе flock ждал бы сам себя
+            next_id = books_file_cache.derive('max_file_id', _max_file_book_id, lock=False) + 1
+        for book in new_books:
+            book['id'] = next_id
+            next_id += 1
+        return next_id - 1
+
+    @staticmethod
+    def touch():
+        """Меняет версию каталога данных без изменения книг - когда БД изменили в обход журнала.
+
+        Статистика, ETag страниц и имена экспортов во всех процессах зависят от подписи
+        books.json, поэтому после touch() они пересчитываются
+        """
+        journal_path = FileHandler.get_journal_file_path()
+        with FileHandler._locked():
+            before = FileHandler.data_signature()
+            with open(journal_path, 'ab'):
+                pass
+            os.utime(journal_path)
+            data_file_written.send(sender=FileHandler, path=journal_path, before=before, rebuilt=True)
+
+    @staticmethod
+    def compact_journal(min_bytes=0):
+        """Переносит журнал в books.json, если он вырос больше min_bytes"""
+        journal_path = FileHandler.get_journal_file_path()
+        with FileHandler._locked():
+            if not os.path.exists(journal_path):
+                return False
+            size = os.path.getsize(journal_path)
+            if size == 0 or size < min_bytes:
+                return False
+
+            before = FileHandler.data_signature()
+            file_path = FileHandler._write_snapshot(FileHandler._read_books())
+            open(journal_path, 'w').close()
+            data_file_written.send(sender=FileHandler, path=file_path, before=before)
+        return True
+
     @staticmethod
     def load_books_from_json():
+        """Книги из books.json с учётом журнала, словарями"""
+        return [record.as_dict() for record in books_file_cache.get()]
+
+    @staticmethod
+    def load_book_records():
+        """Книги из books.json как общий кортеж BookRecord (из кэша, не изменять)"""
+        return books_file_cache.get()
+
+    @staticmethod
+    def load_books_sorted():
+        """Книги из файла по возрастанию (created_at, id) и список этих ключей"""
+        return books_file_cache.derive('sorted', _sort_books)
+
+    @staticmethod
+    def load_books_by_id():
+        """Книги из файла по id (при повторе id - последняя запись)"""
+        return books_file_cache.derive('by_id', lambda books: {book.id: book for book in books})
+
+    @staticmethod
+    def load_search_index():
+        """(книги по возрастанию, их ключи, n-граммный индекс по ним) - всё из одной версии файла"""
+        return books_file_cache.derive('ngram_index', _build_search_index)
+
+    @staticmethod
+    def load_fingerprints():
+        """Отпечатки книг из файла (см. book_fingerprint) - проверка дубликата за O(1)"""
+        return books_file_cache.derive('fingerprints', _book_fingerprints)
+
+    @staticmethod
+    def _read_books():
+        started = time.perf_counter()
+        books = []
+        size = 0
         file_path = FileHandler.get_json_file_path()
         if os.path.exists(file_path):
             with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
+                books = json.load(f)
+                size = os.fstat(f.fileno()).st_size
+
+        journal_path = FileHandler.get_journal_file_path()
+        if not os.path.exists(journal_path):
+            observe_file_io('read', started, size)
+            return books
+
+        # Проигрываем журнал поверх снимка; порядок книг сохраняется
+        by_id = {book.get('id', ('no-id', i)): book for i, book in enumerate(books)}
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # недописанная строка после сбоя
+                if entry['op'] == 'delete':
+                    by_id.pop(entry['id'], None)
+                else:
+                    by_id[entry['book']['id']] = entry['book']
+            size += os.fstat(f.fileno()).st_size
+        observe_file_io('read', started, size)
+        return list(by_id.values())
 
     @staticmethod
-    def export_to_xml():
-        from .models import Book
-        books = Book.objects.all()
-        books_data = []
-        for book in books:
-            books_data.append({
-                'title': book.title,
-                'author': book.author,
-                'isbn': book.isbn,
-                'publication_year': book.publication_year,
-                'genre': book.genre,
-                'langua': book.langua,
-                'page_count': book.page_count,
-                'description': book.description,
-            })
+    def data_signature():
+        """Версия каталога данных: подпись books.json с журналом и mtime самого каталога.
 
-        data_dir = FileHandler.get_data_path()
-        file_path = os.path.join(data_dir, f'books_export_{uuid.uuid4().hex[:8]}.xml')
-
-        root = ET.Element('books')
-        for book_data in books_data:
-            book_elem = ET.SubElement(root, 'book')
-            for key, value in book_data.items():
-                if value is not None:
-                    child = ET.SubElement(book_elem, key)
-                    child.text = str(value)
-
-        xml_str = ET.tostring(root, encoding='utf-8')
-        parsed_xml = minidom.parseString(xml_str)
-        pretty_xml = parsed_xml.toprettyxml(indent="  ")
-
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(pretty_xml)
+        mtime каталога меняется, когда в нём появляются или исчезают файлы (экспорт)
+        """
+        return ParsedFileCache.signature(), os.stat(FileHandler.get_data_path()).st_mtime_ns
+
+    @staticmethod
+    def get_export_path(extension='xml', version=None):
+        # По версии каталога (см. ExportManager) или случайное имя
+        name = version or uuid.uuid4().hex[:8]
+        return os.path.join(FileHandler.get_data_path(), f'books_export_{name}.{extension}')
+
+    @staticmethod
+    def export_to_xml():
+        from .export_manager import ExportManager
+        from .exporters import iter_xml_export
+        file_path, chunks = ExportManager.export('xml', iter_xml_export)
+        for _ in chunks:
+            pass
         return file_path
 
     @staticmethod
@@ -93,12 +296,237 @@ class FileHandler:
         data_dir = FileHandler.get_data_path()
         files = []
         if os.path.exists(data_dir):
-            for filename in os.listdir(data_dir):
-                if filename.endswith(('.json', '.xml')):
-                    file_path = os.path.join(data_dir, filename)
-                    files.append({
-                        'name': filename,
-                        'path': file_path,
-                        'size': os.path.getsize(file_path),
-                    })
-        return files
\ No newline at end of file
+            with os.scandir(data_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(DATA_FILE_EXTENSIONS) and entry.is_file():
+                        stat = entry.stat()
+                        files.append({
+                            'name': entry.name,
+                            'path': entry.path,
+                            'size': stat.st_size,
+                            'mtime_ns': stat.st_mtime_ns,
+                        })
+        return files
+
+    @staticmethod
+    def get_data_file(filename):
+        """Путь к файлу из каталога данных по имени из URL или None, если такого файла нет"""
+        # Только имя без каталогов, чтобы через URL нельзя было выйти за пределы DATA_ROOT
+        if filename != os.path.basename(filename) or not filename.endswith(DATA_FILE_EXTENSIONS):
+            return None
+        file_path = os.path.join(FileHandler.get_data_path(), filename)
+        return file_path if os.path.isfile(file_path) else None
+
+    @staticmethod
+    def read_text_chunk(file_path, offset=0, size=VIEW_CHUNK_BYTES):
+        """Читает size байт с позиции offset и возвращает (текст, начало, конец) в байтах.
+
+        Границы сдвигаются так, чтобы не разрезать многобайтовый символ UTF-8:
+        если offset попал внутрь символа, кусок начинается с его первого байта,
+        а неполный символ в конце остаётся для следующего куска.
+        """
+        started = time.perf_counter()
+        back = min(offset, 3)  # символ UTF-8 занимает не больше 4 байт
+        with open(file_path, 'rb') as f:
+            f.seek(offset - back)
+            data = f.read(size + back)
+            at_eof = not f.read(1)
+
+        start = min(back, len(data))
+        while 0 < start < len(data) and data[start] & 0xC0 == 0x80:
+            start -= 1
+
+        end = len(data)
+        if not at_eof:
+            lead = end - 1
+            while lead > max(start, end - 4) and data[lead] & 0xC0 == 0x80:
+                lead -= 1
+            if lead >= start and data[lead] >= 0xC0:
+                length = 2 if data[lead] < 0xE0 else 3 if data[lead] < 0xF0 else 4
+                if end - lead < length:
+                    end = lead
+
+        text = data[start:end].decode('utf-8', errors='replace')
+        observe_file_io('chunk', started, len(data))
+        return text, offset - back + start, offset - back + end
+
+    @staticmethod
+    def get_preview(file_info):
+        """Начало файла для списка файлов; читается только PREVIEW_BYTES, результат кэшируется по mtime"""
+        key = f"books:preview:{file_info['name']}:{file_info['mtime_ns']}:{file_info['size']}"
+        preview = cache.get(key)
+        if preview is None:
+            try:
+                text, _, end = FileHandler.read_text_chunk(file_info['path'], 0, PREVIEW_BYTES)
+            except OSError:
+                return 'Не удалось прочитать файл'
+            preview = text[:PREVIEW_CHARS]
+            if len(text) > PREVIEW_CHARS or end < file_info['size']:
+                preview += '...'
+            cache.set(key, preview, 24 * 60 * 60)
+        return preview
+
+
+BOOK_FIELDS = (
+    'id', 'title', 'author', 'isbn', 'publication_year', 'genre',
+    'langua', 'page_count', 'description', 'created_at',
+)
+
+
+class BookRecord(namedtuple('BookRecord', BOOK_FIELDS)):
+    """Книга из books.json: неизменяемый кортеж без __dict__, в шаблонах ведёт себя как Book"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data.get('id'),
+            data.get('title') or '',
+            data.get('author') or '',
+            data.get('isbn', ''),
+            data.get('publication_year'),
+            data.get('genre', 'other'),
+            data.get('langua', 'Русский'),
+            data.get('page_count'),
+            data.get('description', ''),
+            data.get('created_at'),
+        )
+
+    def get_genre_display(self):
+        return GENRE_LABELS.get(self.genre, self.genre)
+
+    def as_dict(self):
+        return self._asdict()
+
+    @property
+    def cache_version(self):
+        return book_cache_version(self)
+
+    @property
+    def sort_key(self):
+        return (self.created_at or '', self.id or 0)
+
+
+def _max_file_book_id(records):
+    ids = [record.id for record in records if isinstance(record.id, int) and record.id >= FILE_BOOK_ID_START]
+    return max(ids, default=FILE_BOOK_ID_START - 1)
+
+
+def _book_fingerprints(records):
+    return frozenset(book_fingerprint(record.title, record.author, record.publication_year) for record in records)
+
+
+def _sort_books(records):
+    records = sorted(records, key=lambda record: record.sort_key)
+    return records, [record.sort_key for record in records]
+
+
+def _build_search_index(books):
+    from .file_index import NgramIndex
+    # Сортировка - по тем же книгам, а не по новому чтению файла, которое могло успеть измениться
+    records, keys = books_file_cache.derive('sorted', _sort_books, books=books)
+    return records, keys, NgramIndex(records)
+
+
+# Сколько памяти процесса занимает книга из файла (BookRecord со строками) и построенные
+# по книгам структуры, в байтах на книгу (замер на 100 тыс. книг из seed_books).
+# По этим оценкам ParsedFileCache решает, что вытеснить
+RECORD_BYTES = 1000
+DERIVED_BYTES_PER_BOOK = {'sorted': 80, 'by_id': 60, 'fingerprints': 140, 'ngram_index': 400}
+
+
+class ParsedFileCache:
+    """Кэш разобранного books.json в памяти процесса.
+
+    Ключ - (mtime_ns, size, inode) снимка и журнала, поэтому пока файлы
+    не менялись, чтение стоит два вызова stat() вместо разбора JSON.
+    Хранится одна версия файла: книги и построенные по ним структуры. Книги
+    остаются всегда, а структуры, которые не помещаются в BOOKS_FILE_CACHE_MAX_BYTES,
+    вытесняются - сначала те, к которым дольше не обращались.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signature = None
+        self._books = None
+        self._derived = OrderedDict()  # имя -> (книги, значение, байт); в конце - недавно нужные
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def signature():
+        parts = []
+        for path in (FileHandler.get_json_file_path(), FileHandler.get_journal_file_path()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                parts.append(None)
+            else:
+                parts.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(parts)
+
+    def get(self, lock=True):
+        """Книги из файла; lock=False - если блокировка books.json уже взята"""
+        signature = self.signature()
+        with self._lock:
+            if self._books is not None and signature == self._signature:
+                self.hits += 1
+                return self._books
+            self.misses += 1
+
+        with FileHandler._locked(shared=True) if lock else nullcontext():
+            # Подпись снимаем под блокировкой, чтобы она точно совпала с прочитанным
+            signature = self.signature()
+            books = tuple(BookRecord.from_dict(book) for book in FileHandler._read_books())
+
+        with self._lock:
+            self._signature, self._books, self._derived = signature, books, OrderedDict()
+        return books
+
+    def derive(self, name, build, lock=True, books=None):
+        """Структура, построенная по книгам (сортировка, индекс); живёт, пока не вытеснена.
+
+        books - уже полученные из кэша книги, если структура нужна для той же версии файла
+        """
+        if books is None:
+            books = self.get(lock)
+        with self._lock:
+            derived = self._derived.get(name)
+            if derived is not None and derived[0] is books:
+                self._derived.move_to_end(name)
+                return derived[1]
+
+        value = build(books)
+        with self._lock:
+            if books is self._books:
+                self._derived[name] = (books, value, DERIVED_BYTES_PER_BOOK.get(name, 0) * len(books))
+                self._derived.move_to_end(name)
+                self._evict()
+        return value
+
+    def _evict(self):
+        # Только что построенную структуру не трогаем, иначе она строилась бы на каждый запрос
+        budget = settings.BOOKS_FILE_CACHE_MAX_BYTES - RECORD_BYTES * len(self._books)
+        used = sum(size for _, _, size in self._derived.values())
+        while used > budget and len(self._derived) > 1:
+            _, (_, _, size) = self._derived.popitem(last=False)
+            used -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._signature, self._books, self._derived = None, None, OrderedDict()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'cached': self._books is not None,
+            'derived': list(self._derived),
+        }
+
+
+books_file_cache = ParsedFileCache()
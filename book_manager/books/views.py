@@ -1,85 +1,105 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
 from django.db.models import Q
-import os
 import json
-import random
+import os
 from datetime import datetime
 
-from .models import Book
+from . import metrics
+from .models import Book, GENRE_LABELS, Job
 from .forms import BookForm, FileUploadForm
-from .utils import FileHandler
-
+from .utils import DuplicateBookError, FileHandler, VIEW_CHUNK_BYTES
+from .signals import BOTH_SOURCES, journal_suppressed
+from .snapshot import CatalogSnapshot
+from .stats import CatalogStats, book_stats_values
+from .importers import import_books, MAX_REPORTED_ERRORS
+from .batch import MAX_BATCH_BYTES, BatchError, apply_batch
+from .api import ApiError, get_book, json_response, list_books
+from .conditional import catalog_condition, export_condition
+from .exporters import export_response, iter_json_export, iter_xml_export, ranged_file_response
+from .export_manager import ExportManager
+from .jobs import EXPORT_FORMATS, enqueue_export, enqueue_import
+from .pagination import BOOKS_PER_PAGE, paginate_queryset, paginate_sorted
+from .search_cache import cached_search
+
+@catalog_condition
 def home(request):
-    FileHandler.save_books_to_json()
+    # Количество книг и файлов шаблон берёт из catalog_stats (контекстный процессор)
+    stats = CatalogStats.get()
     context = {
         'page': 'home',
-        'books_count': Book.objects.count(),
-        'files_count': len(FileHandler.get_all_files()),
+        'genre_stats': sorted(
+            ((GENRE_LABELS.get(genre, genre), count) for genre, count in stats['db']['genres'].items()),
+            key=lambda item: -item[1],
+        ),
+        'language_stats': sorted(stats['db']['languages'].items(), key=lambda item: -item[1]),
     }
-    return render(request, 'books/main.html', context)
+    return render(request, 'books/home.html', context)
 
+@catalog_condition
 def book_list(request):
     source = request.GET.get('source', 'db')
     query = request.GET.get('q', '')
+    # Курсорная навигация (по умолчанию) или страницы с номерами (?paging=pages)
+    paging = 'pages' if request.GET.get('paging') == 'pages' else 'cursor'
+    after = request.GET.get('after')
+    before = request.GET.get('before')
 
     if source == 'file':
-        books_data = FileHandler.load_books_from_json()
-        books = []
-        for book_data in books_data:
-            class BookLikeObject:
-                def __init__(self, data):
-                    self.id = data.get('id')
-                    self.title = data.get('title', '')
-                    self.author = data.get('author', '')
-                    self.isbn = data.get('isbn', '')
-                    self.publication_year = data.get('publication_year')
-                    self.genre = data.get('genre', 'other')
-                    self.langua = data.get('langua', 'Русский')
-                    self.page_count = data.get('page_count')
-                    self.description = data.get('description', '')
-                    self.created_at = data.get('created_at')
-
-                def get_genre_display(self):
-                    genre_dict = dict(Book.GENRE_CHOICES)
-                    return genre_dict.get(self.genre, self.genre)
-
-            books.append(BookLikeObject(book_data))
-
+        # Книги из файла уже отсортированы по возрастанию (created_at, id)
         if query:
-            books = [b for b in books if query.lower() in b.title.lower() or query.lower() in b.author.lower()]
+            # Индекс построен по этим же records: позиции совпадений идут в их порядке
+            records, keys, index = FileHandler.load_search_index()
+            matched = index.search(query)
+            records = [records[i] for i in matched]
+            keys = [keys[i] for i in matched]
+        else:
+            records, keys = FileHandler.load_books_sorted()
 
-        books.sort(key=lambda x: x.created_at if x.created_at else '', reverse=True)
+        # Записи BookRecord шаблон показывает напрямую, как объекты Book
+        if paging == 'cursor':
+            page_obj = paginate_sorted(records, keys, after, before)
+        else:
+            page_obj = Paginator(records[::-1], BOOKS_PER_PAGE).get_page(request.GET.get('page'))
+        books_count = len(records)
     else:
         if query:
             books = Book.objects.filter(
                 Q(title__icontains=query) |
                 Q(author__icontains=query) |
                 Q(description__icontains=query)
-            ).order_by('-created_at')
+            )
         else:
-            books = Book.objects.all().order_by('-created_at')
+            books = Book.objects.all()
 
-    paginator = Paginator(books, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        if paging == 'cursor':
+            # Без OFFSET и COUNT(*): страница выбирается по индексу (created_at, id)
+            page_obj = paginate_queryset(books, after, before)
+            books_count = None if query else CatalogStats.get()['db']['total']
+        else:
+            paginator = Paginator(books.order_by('-created_at', '-id'), BOOKS_PER_PAGE)
+            if not query:
+                # Без поиска COUNT(*) не нужен - количество есть в статистике
+                paginator.count = CatalogStats.get()['db']['total']
+            page_obj = paginator.get_page(request.GET.get('page'))
+            books_count = paginator.count
 
     context = {
         'page': 'book_list',
         'page_obj': page_obj,
-        'books_count': len(books) if source == 'file' else books.count(),
+        'paging': paging,
+        'books_count': books_count,
         'current_source': source,
         'search_query': query
     }
-    return render(request, 'books/main.html', context)
-
-from django.http import JsonResponse
-from django.db.models import Q
-from django.views.decorators.csrf import csrf_exempt
-from .utils import FileHandler
+    return render(request, 'books/book_list.html', context)
 
 @csrf_exempt
 def search_books_ajax(request):
@@ -93,82 +113,67 @@ def search_books_ajax(request):
     if len(query) < 2:
         return JsonResponse([], safe=False) # Возвращаем пустой список
     
-    # Для всех найденных книг
-    results = []
-
-    
-    # начало блока обработки исключений в Python.
     try:
-        # Поиск в базе данных
-        db_books = Book.objects.filter( # Cтандартный способ фильтрации записей в Django.
-            Q(title__icontains=query) | 
-            Q(author__icontains=query) |
-            Q(description__icontains=query) |
-            Q(isbn__icontains=query) |
-            Q(genre__icontains=query) |
-            Q(langua__icontains=query)
-        )[:10]  # Ограничиваем 10 результатами из БД
-
-        # Преобразует найденные книги из бд с нужными полями 
-        for book in db_books:
-            results.append({
-                'id': book.id,
-                'title': book.title,
-                'author': book.author,
-                'publication_year': book.publication_year,
-                'genre': book.get_genre_display(),
-                'langua': book.langua or '',
-                'edit_url': f"/books/{book.id}/edit/", # даёт путь вида, по которому отправляется запрос, чтобы открыть форму редактирования книги
-                'delete_url': f"/books/{book.id}/delete/",
-                'source': 'db'
-            })
-
-        # 2. Поиск в файле
-        try:
-            books_from_file = FileHandler.load_books_from_json() 
-            # load_books_from_json() — статический или классовый метод, открывает json файл, читает и возвращает
-
-            for book_data in books_from_file:
-                # Проверяем совпадения 
-                # Получает значение по ключу титл
-                title_match = query.lower() in str(book_data.get('title', '')).lower()
-                author_match = query.lower() in str(book_data.get('author', '')).lower()
-
-                # Если совпадают один из них:
-                if title_match or author_match:
-                    genre = book_data.get('genre', 'other')
-                    # Если его нет — используем 'other' (значение по умолчанию)
-                    # Преобразует список в словарь, преобразуем внутреннее значение жанра (например, "fantasy") в читаемое название 
-                    genre_display = dict(Book.GENRE_CHOICES).get(genre, genre)
-
-                    # Получаем id книги из json
-                    book_id = book_data.get('id', 0)
-                    # Добавляем новую карточку книги в общий список результатов
-                    results.append({
-                        'id': book_id,
-                        'title': book_data.get('title', ''),
-                        'author': book_data.get('author', ''),
-                        'publication_year': book_data.get('publication_year', ''),
-                        'genre': genre_display,
-                        'langua': book_data.get('langua', ''),
-                        'edit_url': f"/books/{book_id}/edit/" if book_id else '#',
-                        'delete_url': f"/books/{book_id}/delete/" if book_id else '#',
-                        'source': 'file'
-                    })
-
-                    if len(results) >= 15:  # Общее ограничение
-                        break
-
-        except Exception as e:
-            print(f"Ошибка при поиске в файле: {e}")
-            # Продолжаем работу
-
+        # Результаты кэшируются по запросу и версиям каталога в БД и в файле
+        results = cached_search(query)
     except Exception as e:
         print(f"Ошибка в поиске: {e}")
         return JsonResponse([], safe=False)
-    
+
     # Отправляет первые 15 найденных книг в формате JSON
-    return JsonResponse(results[:15], safe=False)  
+    return JsonResponse(results, safe=False)
+
+@require_GET
+def api_books(request):
+    """JSON API: список книг с выбором полей (?fields=), фильтрами и курсором (?after=)"""
+    try:
+        return json_response(list_books(request.GET))
+    except ApiError as e:
+        return json_response({'error': str(e)}, status=400)
+
+@require_GET
+def api_book(request, book_id):
+    try:
+        book = get_book(book_id, request.GET)
+    except ApiError as e:
+        return json_response({'error': str(e)}, status=400)
+    if book is None:
+        return json_response({'error': 'книга не найдена'}, status=404)
+    return json_response(book)
+
+def _batch_error(message, status):
+    return JsonResponse({'errors': [{'op': None, 'index': None, 'error': message}]}, status=status)
+
+@require_POST
+def books_batch(request):
+    """JSON API: {"create": [...], "update": [{"id": ..., ...}], "delete": [id, ...]} одной транзакцией.
+
+    Только для персонала; запрос из браузера проходит обычную проверку CSRF
+    (токен в заголовке X-CSRFToken)
+    """
+    if not request.user.is_staff:
+        return _batch_error('нужен вход под учётной записью персонала', 403)
+    if request.content_type != 'application/json':
+        return _batch_error('ожидалось тело application/json', 415)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > MAX_BATCH_BYTES:
+        return _batch_error(f'тело запроса больше {MAX_BATCH_BYTES} байт', 413)
+
+    try:
+        # Читаем поток, а не request.body: пакет может быть больше DATA_UPLOAD_MAX_MEMORY_SIZE
+        payload = json.load(request)
+    except ValueError:
+        return _batch_error('некорректный JSON', 400)
+
+    try:
+        result = apply_batch(payload)
+    except BatchError as e:
+        errors = [{'op': op, 'index': index, 'error': message} for op, index, message in e.errors]
+        return JsonResponse({'errors': errors}, status=400)
+    return JsonResponse(result)
 
 def add_book(request):
     if request.method == 'POST':
@@ -177,12 +182,9 @@ def add_book(request):
             save_location = form.cleaned_data['save_location']
 
             if save_location == 'file':
-                # Сохраняем только в файл
-                file_path = FileHandler.get_json_file_path()
-                existing_books = FileHandler.load_books_from_json()
-
+                # Сохраняем только в файл: дописываем запись в журнал
                 new_book = {
-                    'id': random.randint(1000, 9999),
+                    'id': None,  # выдаст append_to_journal под блокировкой файла
                     'title': form.cleaned_data['title'],
                     'author': form.cleaned_data['author'],
                     'isbn': form.cleaned_data['isbn'],
@@ -194,53 +196,59 @@ def add_book(request):
                     'created_at': datetime.now().isoformat(),
                 }
 
-                existing_books.append(new_book)
-
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(existing_books, f, ensure_ascii=False, indent=2)
+                try:
+                    # Дубликат ищется под блокировкой журнала: два одновременных запроса не запишут книгу дважды
+                    CatalogSnapshot.record(
+                        [{'op': 'insert', 'book': new_book}],
+                        [(('file',), None, book_stats_values(new_book))],
+                        unique=True,
+                    )
+                except DuplicateBookError:
+                    messages.error(request, 'Такая книга уже есть в файле!')
+                    return render(request, 'books/add_book.html', {'page': 'add_book', 'form': form})
 
                 messages.success(request, 'Книга сохранена в файл!')
 
             elif save_location == 'db':
-                # Сохраняем только в БД
-                duplicate = Book.objects.filter(
-                    title=form.cleaned_data['title'],
-                    author=form.cleaned_data['author'],
-                    publication_year=form.cleaned_data['publication_year']
-                ).exists()
-
-                if duplicate:
+                # Сохраняем только в БД; дубликат не пропустит уникальный индекс fingerprint
+                try:
+                    with transaction.atomic():
+                        book = form.save()
+                except IntegrityError:
                     messages.error(request, 'Такая книга уже существует в базе данных!')
-                    return render(request, 'books/main.html', {'page': 'add_book', 'form': form})
-
-                book = form.save()
+                    return render(request, 'books/add_book.html', {'page': 'add_book', 'form': form})
                 messages.success(request, f'Книга "{book.title}" сохранена в базу данных!')
 
             elif save_location == 'both':
-                # Сохраняем в оба места
-                duplicate = Book.objects.filter(
-                    title=form.cleaned_data['title'],
-                    author=form.cleaned_data['author'],
-                    publication_year=form.cleaned_data['publication_year']
-                ).exists()
-
-                if duplicate:
+                # Сохраняем в оба места. Дубликат в БД не пропустит уникальный индекс, в файле -
+                # проверка под блокировкой журнала; журнал пишем сами, до фиксации транзакции,
+                # чтобы книга, которая уже есть в файле, откатилась и из БД
+                try:
+                    with transaction.atomic():
+                        with journal_suppressed():
+                            book = form.save()
+                        CatalogSnapshot.record(
+                            [{'op': 'insert', 'book': FileHandler.book_to_dict(book)}],
+                            [(BOTH_SOURCES, None, book_stats_values(book))],
+                            unique=True,
+                        )
+                except IntegrityError:
                     messages.error(request, 'Такая книга уже существует в базе данных!')
-                    return render(request, 'books/main.html', {'page': 'add_book', 'form': form})
-
-                book = form.save()
-                FileHandler.save_books_to_json()
+                    return render(request, 'books/add_book.html', {'page': 'add_book', 'form': form})
+                except DuplicateBookError:
+                    messages.error(request, 'Такая книга уже есть в файле!')
+                    return render(request, 'books/add_book.html', {'page': 'add_book', 'form': form})
                 messages.success(request, f'Книга "{book.title}" сохранена и в базу, и в файл!')
 
             return redirect('book_list')
         else:
             context = {'page': 'add_book', 'form': form}
-            return render(request, 'books/main.html', context)
+            return render(request, 'books/add_book.html', context)
     else:
         form = BookForm()
 
     context = {'page': 'add_book', 'form': form}
-    return render(request, 'books/main.html', context)
+    return render(request, 'books/add_book.html', context)
 
 def edit_book(request, book_id):
     book = get_object_or_404(Book, id=book_id)
@@ -248,19 +256,25 @@ def edit_book(request, book_id):
     if request.method == 'POST':
         form = BookForm(request.POST, instance=book)
         if form.is_valid():
-            form.save()
-            FileHandler.save_books_to_json()
+            try:
+                with transaction.atomic():
+                    form.save()
+            except IntegrityError:
+                # Новые название, автор и год совпали с другой книгой
+                messages.error(request, 'Такая книга уже существует в базе данных!')
+                context = {'page': 'edit_book', 'form': form, 'book': book}
+                return render(request, 'books/edit_book.html', context)
             messages.success(request, f'Книга "{book.title}" успешно обновлена!')
             return redirect('book_list')
         else:
             context = {'page': 'edit_book', 'form': form, 'book': book}
-            return render(request, 'books/main.html', context)
+            return render(request, 'books/edit_book.html', context)
     else:
         form = BookForm(instance=book)
         form.fields.pop('save_location', None)
 
     context = {'page': 'edit_book', 'form': form, 'book': book}
-    return render(request, 'books/main.html', context)
+    return render(request, 'books/edit_book.html', context)
 
 def delete_book(request, book_id):
     book = get_object_or_404(Book, id=book_id)
@@ -268,40 +282,49 @@ def delete_book(request, book_id):
     if request.method == 'POST':
         book_title = book.title
         book.delete()
-        FileHandler.save_books_to_json()
         messages.success(request, f'Книга "{book_title}" успешно удалена!')
         return redirect('book_list')
 
     context = {'page': 'delete_book', 'book': book}
-    return render(request, 'books/main.html', context)
+    return render(request, 'books/delete_book.html', context)
 
 def export_books(request):
     if request.method == 'POST':
         file_type = request.POST.get('file_type')
 
-        try:
-            if file_type == 'json':
-                file_path = FileHandler.save_books_to_json()
-                content_type = 'application/json'
-                filename = 'books.json'
-            else:
-                file_path = FileHandler.export_to_xml()
-                content_type = 'application/xml'
-                filename = os.path.basename(file_path)
-
-            with open(file_path, 'rb') as f:
-                response = HttpResponse(f.read(), content_type=content_type)
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                return response
+        if settings.BOOKS_BACKGROUND_JOBS:
+            # Экспорт соберёт воркер (manage.py run_jobs), а файл скачается со страницы задачи
+            job = enqueue_export(file_type if file_type in EXPORT_FORMATS else 'xml')
+            return redirect('job_status', job_id=job.id)
 
+        try:
+            return _export_file(request, file_type)
         except Exception as e:
             messages.error(request, f'Ошибка: {str(e)}')
 
     context = {
         'page': 'export_books',
-        'books_count': Book.objects.count()
+        'books_count': CatalogStats.get()['db']['total']
     }
-    return render(request, 'books/main.html', context)
+    return render(request, 'books/export_books.html', context)
+
+def _export_file(request, file_type):
+    if file_type == 'json':
+        return export_response(request, iter_json_export(), 'application/json', 'books.json')
+    elif file_type == 'ndjson':
+        return export_response(request, iter_json_export(lines=True), 'application/x-ndjson', 'books.ndjson')
+    else:
+        # XML сохраняется в DATA_ROOT; пока каталог не менялся, отдаётся готовый файл
+        file_path, chunks = ExportManager.export('xml', iter_xml_export)
+        return export_response(request, chunks, 'application/xml', os.path.basename(file_path))
+
+@require_GET
+@export_condition
+def export_download(request, file_type):
+    """Экспорт по GET - для клиентов, которые опрашивают каталог: 304, пока он не менялся"""
+    if file_type not in EXPORT_FORMATS:
+        raise Http404('Неизвестный формат экспорта')
+    return _export_file(request, file_type)
 
 def upload_file(request):
     if request.method == 'POST':
@@ -310,37 +333,20 @@ def upload_file(request):
             file = request.FILES['file']
             file_type = form.cleaned_data['file_type']
 
+            if settings.BOOKS_BACKGROUND_JOBS:
+                # Файл сохраняется на диск, импортирует его воркер
+                job = enqueue_import(file, file_type)
+                messages.info(request, f'Файл "{file.name}" поставлен в очередь на импорт')
+                return redirect('job_status', job_id=job.id)
+
             try:
-                content = file.read().decode('utf-8')
-
-                if file_type == 'json':
-                    books_data = json.loads(content)
-                else:
-                    import xml.etree.ElementTree as ET
-                    root = ET.fromstring(content)
-                    books_data = []
-                    for book_elem in root.findall('book'):
-                        book_data = {}
-                        for child in book_elem:
-                            book_data[child.tag] = child.text
-                        books_data.append(book_data)
-
-                imported_count = 0
-                for book_data in books_data:
-                    Book.objects.create(
-                        title=book_data['title'],
-                        author=book_data['author'],
-                        isbn=book_data.get('isbn', ''),
-                        publication_year=int(book_data['publication_year']),
-                        genre=book_data.get('genre', 'other'),
-                        langua=book_data.get('langua', 'Русский'),
-                        page_count=book_data.get('page_count'),
-                        description=book_data.get('description', ''),
-                    )
-                    imported_count += 1
+                # Файл разбирается потоково и сохраняется пакетами
+                result = import_books(file, file_type)
+                messages.success(request, f'Импортировано {result.imported} книг!')
 
-                FileHandler.save_books_to_json()
-                messages.success(request, f'Импортировано {imported_count} книг!')
+                if result.errors:
+                    details = '; '.join(f'запись {row}: {error}' for row, error in result.errors[:MAX_REPORTED_ERRORS])
+                    messages.warning(request, f'Пропущено записей с ошибками: {len(result.errors)} ({details})')
 
             except Exception as e:
                 messages.error(request, f'Ошибка: {str(e)}')
@@ -348,45 +354,99 @@ def upload_file(request):
             return redirect('upload_file')
         else:
             context = {'page': 'upload_file', 'form': form}
-            return render(request, 'books/main.html', context)
+            return render(request, 'books/upload_file.html', context)
     else:
         form = FileUploadForm()
 
     context = {'page': 'upload_file', 'form': form}
-    return render(request, 'books/main.html', context)
+    return render(request, 'books/upload_file.html', context)
 
 def file_list(request):
     files = FileHandler.get_all_files()
 
     for file_info in files:
-        try:
-            with open(file_info['path'], 'r', encoding='utf-8') as f:
-                content = f.read()
-                file_info['preview'] = content[:200] + '...' if len(content) > 200 else content
-        except:
-            file_info['preview'] = 'Не удалось прочитать файл'
+        # Читается только начало файла, и то если превью нет в кэше
+        file_info['preview'] = FileHandler.get_preview(file_info)
 
     context = {
         'page': 'file_list',
         'files': files,
         'files_count': len(files)
     }
-    return render(request, 'books/main.html', context)
+    return render(request, 'books/file_list.html', context)
 
 def view_file(request, filename):
-    data_dir = FileHandler.get_data_path()
-    file_path = os.path.join(data_dir, filename)
+    file_path = FileHandler.get_data_file(filename)
+
+    if file_path is not None:
+        if request.GET.get('raw'):
+            # Файл целиком потоком или его часть по заголовку Range
+            content_type = 'application/xml' if filename.endswith('.xml') else 'application/json'
+            return ranged_file_response(request, file_path, f'{content_type}; charset=utf-8')
 
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Постраничный просмотр: в память читается только одна страница файла
+        size = os.path.getsize(file_path)
+        try:
+            offset = min(max(int(request.GET.get('offset', 0)), 0), size)
+        except ValueError:
+            offset = 0
+        content, start, end = FileHandler.read_text_chunk(file_path, offset)
 
         context = {
             'page': 'view_file',
             'filename': filename,
-            'content': content
+            'content': content,
+            'size': size,
+            'start': start,
+            'end': end,
+            'next_offset': end if end < size else None,
+            'previous_offset': max(start - VIEW_CHUNK_BYTES, 0) if start > 0 else None,
         }
-        return render(request, 'books/main.html', context)
+        return render(request, 'books/view_file.html', context)
     else:
         messages.error(request, 'Файл не найден')
-        return redirect('file_list')
\ No newline at end of file
+        return redirect('file_list')
+
+def job_status(request, job_id):
+    job = get_object_or_404(Job, id=job_id)
+
+    # Страница задачи опрашивает этот же адрес с ?format=json
+    if request.GET.get('format') == 'json':
+        return JsonResponse(job.as_dict())
+
+    context = {'page': 'job', 'job': job}
+    return render(request, 'books/job.html', context)
+
+def job_download(request, job_id):
+    job = get_object_or_404(Job, id=job_id)
+    if not job.is_downloadable or not os.path.exists(job.result_path):
+        raise Http404('Файл задачи не найден')
+
+    if job.kind == Job.KIND_EXPORT:
+        content_type = EXPORT_FORMATS[job.params['format']][2]
+    else:
+        content_type = 'application/octet-stream'
+    response = ranged_file_response(request, job.result_path, content_type)
+    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(job.result_path)}"'
+    return response
+
+# Адреса, с которых /metrics/ доступен без входа (сборщик Prometheus на той же машине)
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in LOCAL_ADDRESSES and not request.user.is_staff:
+        return HttpResponseForbidden('Метрики доступны только локально или персоналу')
+    if not metrics.is_enabled():
+        raise Http404('Метрики отключены (BOOKS_METRICS)')
+    return HttpResponse(metrics.registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@staff_member_required
+def metrics_dashboard(request):
+    views, file_io = metrics.dashboard_rows()
+    context = {
+        'page': 'metrics',
+        'metrics_enabled': metrics.is_enabled(),
+        'view_metrics': views,
+        'file_io_metrics': file_io,
+    }
+    return render(request, 'books/metrics.html', context)